@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Optional
+
+from mutagen import File, MutagenError
+from mutagen.mp3 import MP3
+from mutagen.oggopus import OggOpus
+from pathvalidate import sanitize_filename
+from tqdm import tqdm
+
+from util import types, database
+from util.io import get_track_filename, get_output_pipe
+
+AUDIO_EXTENSIONS: tuple[str, ...] = ("opus", "mp3")
+# issues, that are fixed by downloading the track again
+REQUEUED_ISSUES: tuple[str, ...] = ("missing", "corrupt", "codec", "duration")
+# issues, that are fixed by rewriting the tags
+RETAGGED_ISSUES: tuple[str, ...] = ("tags",)
+
+
+class Arguments:
+    threads: int
+    tolerance: float
+    requeue: bool
+    background: bool
+    destination: Path
+
+
+def parse_args() -> Arguments:
+    parser = argparse.ArgumentParser(
+        description="Check that the downloaded tracks of a library are complete"
+    )
+    default_thread_count: int = os.cpu_count() or 4
+    parser.add_argument(
+        "--threads",
+        "-t",
+        default=default_thread_count,
+        type=int,
+        help=f"The number of processes checking files, default: {default_thread_count}",
+    )
+    parser.add_argument(
+        "--tolerance",
+        default=5.0,
+        type=float,
+        help="Allowed difference between file and track duration in seconds, default: 5",
+    )
+    parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="Download missing and damaged tracks again, and rewrite missing tags,"
+        " with the next update of their album",
+    )
+    parser.add_argument(
+        "--background",
+        "-b",
+        action="store_true",
+        help="Run in Background mode, only returning a final json",
+    )
+    parser.add_argument(
+        "destination",
+        metavar="D",
+        type=Path,
+        help="The directory of the music collection",
+    )
+    args: Arguments = parser.parse_args(namespace=Arguments())
+    types.Options.background = args.background
+    return args
+
+
+def scan_library(destination: Path) -> dict[str, str]:
+    """
+    :return: the lower case path relative to the library of every file,
+        mapped to its actual path. Directories are matched case-insensitive.
+    """
+    files: dict[str, str] = {}
+    pending: list[str] = [str(destination)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    files[os.path.relpath(entry.path, destination).lower()] = entry.path
+    return files
+
+
+def check_file(path: str, duration: int, tolerance: float) -> Optional[tuple[str, str]]:
+    """
+    Checks the container headers and tags, without decoding the audio
+    :return: the issue and a description of it, if there is one
+    """
+    try:
+        audio = File(path)
+    except (MutagenError, OSError, ValueError) as e:
+        return "corrupt", str(e) or type(e).__name__
+    if audio is None:
+        return "corrupt", "unknown format"
+    expected: type = MP3 if path.endswith(".mp3") else OggOpus
+    if not isinstance(audio, expected):
+        return "codec", type(audio).__name__
+    length: float = audio.info.length
+    if duration > 0 and abs(length - duration) > tolerance:
+        return "duration", f"{length:.1f}s instead of {duration}s"
+    title_tag: str = "TIT2" if expected is MP3 else "title"
+    if not audio.tags or title_tag not in audio.tags:
+        return "tags", "no title"
+    return None
+
+
+def audit(destination: Path, threads: int, tolerance: float) -> list[types.AuditIssue]:
+    files: dict[str, str] = scan_library(destination)
+    issues: list[types.AuditIssue] = []
+    checked: list[tuple[int, str, int]] = []
+    for tid, _, title, duration, track_id, artist_path, album_path in (
+        database.get_library_tracks()
+    ):
+        album_directory: str = os.path.join(
+            sanitize_filename(artist_path), sanitize_filename(album_path)
+        )
+        path: Optional[str] = None
+        for extension in AUDIO_EXTENSIONS:
+            name: str = get_track_filename(track_id, title, extension)
+            path = files.pop(os.path.join(album_directory, name).lower(), None)
+            if path:
+                break
+        if path:
+            checked.append((tid, path, duration))
+        else:
+            missing: str = str(
+                destination.joinpath(album_directory, get_track_filename(track_id, title, "*"))
+            )
+            issues.append({"issue": "missing", "path": missing, "detail": "", "tid": tid})
+    with ProcessPoolExecutor(threads) as executor:
+        results = executor.map(
+            check_file,
+            [path for _, path, _ in checked],
+            [duration for _, _, duration in checked],
+            repeat(tolerance),
+            chunksize=256,
+        )
+        progress = tqdm(
+            results,
+            total=len(checked),
+            desc="Checking tracks",
+            unit="track",
+            file=get_output_pipe(),
+        )
+        for (tid, path, _), result in zip(checked, progress):
+            if result:
+                issues.append({"issue": result[0], "path": path, "detail": result[1], "tid": tid})
+    for path in files.values():
+        if path.rsplit(".", 1)[-1] in AUDIO_EXTENSIONS:
+            issues.append({"issue": "orphan", "path": path, "detail": "", "tid": None})
+    return issues
+
+
+def process_args(args: Arguments):
+    database.init(args.destination.joinpath("music-channel-downloader.db"))
+    issues: list[types.AuditIssue] = audit(args.destination, args.threads, args.tolerance)
+    if args.requeue:
+        database.requeue_tracks(
+            [issue["tid"] for issue in issues if issue["issue"] in REQUEUED_ISSUES]
+        )
+        database.forget_track_tags(
+            [issue["tid"] for issue in issues if issue["issue"] in RETAGGED_ISSUES]
+        )
+    if args.background:
+        print(json.dumps(issues))
+        return
+    for issue in issues:
+        print(f'{issue["issue"]:>8}: {issue["path"]} {issue["detail"]}')
+    counts: dict[str, int] = {}
+    for issue in issues:
+        counts[issue["issue"]] = counts.get(issue["issue"], 0) + 1
+    summary: str = ", ".join(f"{count} {issue}" for issue, count in sorted(counts.items()))
+    print(summary or "No issues found")
+
+
+if __name__ == "__main__":
+    input_args: Arguments = parse_args()
+    process_args(input_args)
@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+"""
+Compares the previous greedy album/playlist matching with the order preserving
+alignment on synthetic compilations, where part of the tracks have no video.
+
+usage: python -m benchmark.album_matching [track counts ...]
+"""
+
+import random
+import sys
+import timeit
+from typing import Dict, List, Optional
+
+from fuzzywuzzy import fuzz, process
+
+from process.util import align_tracks, score_matrix
+from util.types import PlaylistEntry, Track
+
+WORDS: List[str] = (
+    "love night heart fire dream time rain light dance road summer blue "
+    "home stars run wild gold river shadow dark sky ocean down free"
+).split()
+
+
+def get_compilation(
+    track_count: int, seed: int = 0
+) -> tuple[List[Track], List[PlaylistEntry], List[Optional[int]]]:
+    rng = random.Random(seed)
+    tracks: List[Track] = []
+    for i in range(track_count):
+        title: str = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.2:
+            # compilations tend to contain several versions of the same song
+            title += rng.choice([" (Live)", " (Remix)", " (Radio Edit)"])
+        tracks.append({"title": title, "duration_seconds": rng.randint(120, 420)})
+    present: List[int] = sorted(rng.sample(range(track_count), int(track_count * 0.8)))
+    videos: List[PlaylistEntry] = [
+        {
+            "title": tracks[i]["title"],
+            "duration_seconds": tracks[i]["duration_seconds"] + rng.randint(-1, 1),
+        }
+        for i in present
+    ]
+    expected: List[Optional[int]] = [None] * track_count
+    for j, i in enumerate(present):
+        expected[i] = j
+    return tracks, videos, expected
+
+
+def get_best_match(present_titles: List[str], current_track: Track) -> int:
+    """the title score used by the greedy matching"""
+    result: Optional[tuple[str, int]] = process.extractOne(
+        current_track["title"], present_titles, scorer=fuzz.ratio
+    )
+    if result:
+        return result[1]
+    return 0
+
+
+def greedy_match(tracks: List[Track], videos: List[PlaylistEntry]) -> List[Optional[int]]:
+    """the matching used before the alignment, for comparison"""
+    titles: List[str] = [video["title"] for video in videos]
+    rating: Dict[int, int] = {
+        i: get_best_match(titles, track) for i, track in enumerate(tracks)
+    }
+    album_len: int = len(tracks)
+    while album_len > len(videos):
+        worst_score: int = min(rating.values())
+        worst_idx: int = next(i for i, v in rating.items() if v == worst_score)
+        del rating[worst_idx]
+        album_len -= 1
+    indices = iter(range(len(videos)))
+    return [next(indices) if idx in rating else None for idx in range(len(tracks))]
+
+
+def aligned_match(tracks: List[Track], videos: List[PlaylistEntry]) -> List[Optional[int]]:
+    return align_tracks(score_matrix(tracks, videos))
+
+
+def accuracy(result: List[Optional[int]], expected: List[Optional[int]]) -> float:
+    return sum(a == b for a, b in zip(result, expected)) / len(expected)
+
+
+def run(track_counts: List[int]):
+    print(f"{'tracks':>6} {'method':>8} {'ms/album':>10} {'accuracy':>9}")
+    for track_count in track_counts:
+        tracks, videos, expected = get_compilation(track_count)
+        for name, method in (("greedy", greedy_match), ("aligned", aligned_match)):
+            repeat: int = 3
+            duration: float = timeit.timeit(lambda: method(tracks, videos), number=repeat)
+            result: List[Optional[int]] = method(tracks, videos)
+            print(
+                f"{track_count:>6} {name:>8} {duration / repeat * 1000:>10.1f}"
+                f" {accuracy(result, expected):>9.1%}"
+            )
+
+
+if __name__ == "__main__":
+    run([int(i) for i in sys.argv[1:]] or [20, 100, 200, 400])
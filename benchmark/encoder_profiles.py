@@ -0,0 +1,117 @@
+#! /usr/bin/env python
+"""
+Calibrates the encoder profiles on the current host: encodes a reference set
+with every profile, and reports the encoding time and output size per track,
+to pick the --encoder-profile, that keeps up with the download rate.
+The reference set is generated, unless audio files are supplied.
+The loudness is measured once per file, as it does not depend on the profile.
+
+usage: python -m benchmark.encoder_profiles [-h] [--tracks T] [--seconds S] [--mp3] [files ...]
+"""
+
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from util import types
+from util.convert_audio import Metadata, StreamMetadata, level_and_combine_audio, measure_loudness
+
+
+def generate_reference(directory: Path, tracks: int, seconds: int) -> List[Path]:
+    """:return: tracks of a tone over pink noise, at different levels, like downloaded ones"""
+    paths: List[Path] = []
+    for i in range(tracks):
+        path: Path = directory.joinpath(f"reference{i}.webm")
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-y",
+                "-f", "lavfi",
+                "-i", f"sine=frequency={220 * (i + 1)}:duration={seconds}:sample_rate=48000",
+                "-f", "lavfi",
+                "-i", f"anoisesrc=color=pink:amplitude={0.1 + 0.2 * (i % 3)}"
+                f":duration={seconds}:sample_rate=48000",
+                "-filter_complex", "amix=inputs=2", "-ac", "2",
+                "-c:a", "libopus", "-b:a", "128k", str(path),
+            ],
+            check=True,
+        )
+        paths.append(path)
+    return paths
+
+
+def get_children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def calibrate(sources: List[Path], directory: Path) -> Dict[str, Dict[str, float]]:
+    """:return: per profile, the mean wall and cpu seconds and the mean size per track"""
+    metadata = Metadata("Reference", "Artist", "Calibration", "2024", 1, [])
+    prepared: List[tuple[str, StreamMetadata, dict[str, str]]] = []
+    for source in sources:
+        stream_metadata: StreamMetadata = StreamMetadata.from_probe(str(source))
+        prepared.append((str(source), stream_metadata, measure_loudness(str(source), [])))
+    extension: str = "mp3" if types.Options.mp3 else "opus"
+    profile: str = types.Options.encoder_profile
+    results: Dict[str, Dict[str, float]] = {}
+    for name in types.ENCODER_PROFILES:
+        types.Options.encoder_profile = name
+        durations: List[float] = []
+        cpu_seconds: List[float] = []
+        sizes: List[int] = []
+        for i, (source, stream_metadata, loudness) in enumerate(prepared):
+            output: Path = directory.joinpath(f"{name}{i}.{extension}")
+            start: float = time.perf_counter()
+            start_cpu: float = get_children_cpu_seconds()
+            if not level_and_combine_audio(
+                source, output, metadata, loudness=loudness, stream_metadata=stream_metadata
+            ):
+                raise SystemExit(f"encoding {source} with the {name} profile failed")
+            durations.append(time.perf_counter() - start)
+            cpu_seconds.append(get_children_cpu_seconds() - start_cpu)
+            sizes.append(output.stat().st_size)
+            output.unlink()
+        results[name] = {
+            "seconds": statistics.mean(durations),
+            "cpu_seconds": statistics.mean(cpu_seconds),
+            "size": statistics.mean(sizes),
+        }
+    types.Options.encoder_profile = profile
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the encoder profiles on this host")
+    parser.add_argument("files", nargs="*", type=Path, help="reference audio, default: generated")
+    parser.add_argument("--tracks", type=int, default=3, help="generated tracks, default: 3")
+    parser.add_argument(
+        "--seconds", type=int, default=240, help="length of generated tracks, default: 240"
+    )
+    parser.add_argument("--mp3", action="store_true", help="encode mp3 files instead of ogg files")
+    return parser.parse_args()
+
+
+def run(files: List[Path], tracks: int, seconds: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        sources: List[Path] = files or generate_reference(directory, tracks, seconds)
+        results = calibrate(sources, directory)
+    archival: Dict[str, float] = results["archival"]
+    print(f"{len(sources)} tracks, {'mp3' if types.Options.mp3 else 'opus'}")
+    print(f"{'profile':>10} {'s/track':>9} {'cpu s/track':>12} {'KiB/track':>10} {'speedup':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:>10} {result['seconds']:>9.2f} {result['cpu_seconds']:>12.2f}"
+            f" {result['size'] / 1024:>10.0f} {archival['seconds'] / result['seconds']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    types.Options.mp3 = args.mp3
+    run(args.files, args.tracks, args.seconds)
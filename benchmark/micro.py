@@ -0,0 +1,236 @@
+#! /usr/bin/env python
+"""
+Micro benchmarks of the per track and per album hot paths on synthetic large
+inputs (200 track albums, 10k line descriptions), compared against the
+baselines stored in benchmark/baselines.json. Baselines are machine specific,
+update them with --update on the machine the comparison runs on.
+
+usage: python -m benchmark.micro [-h] [--update] [--tolerance T] [names ...]
+"""
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import process.util
+from benchmark.album_matching import WORDS, get_compilation
+from benchmark.video_scoring import get_results
+from process.track import merge_description, pick_results, score_result
+from process.util import align_tracks, match_playlist_and_album, score_matrix
+from process_album_video import ROW_REGEX, find_track_information
+from util import types
+from util.convert_audio import Metadata
+
+BASELINES: Path = Path(__file__).parent.joinpath("baselines.json")
+ALBUM_SIZE: int = 200
+DESCRIPTION_LINES: int = 10_000
+
+
+def get_album(track_count: int = ALBUM_SIZE) -> tuple[types.Album, List[types.PlaylistEntry]]:
+    tracks, videos, _ = get_compilation(track_count)
+    artists: List[types.AlbumArtist] = [{"name": "Artist", "id": "..."}]
+    album: types.Album = {
+        "title": "Compilation",
+        "thumbnails": [],
+        "artists": artists,
+        "year": "2021",
+        "trackCount": track_count,
+        "duration": "...",
+        "duration_seconds": 0,
+        "tracks": [
+            {
+                "videoId": f"video{i:06}",
+                "title": track["title"],
+                "artists": [*artists, {"name": f"Guest {i}", "id": "..."}],
+                "album": "Compilation",
+                "duration": f'{track["duration_seconds"] // 60}:{track["duration_seconds"] % 60:02}',
+                "duration_seconds": track["duration_seconds"],
+                "thumbnails": None,
+                "isAvailable": True,
+                "isExplicit": False,
+            }
+            for i, track in enumerate(tracks)
+        ],
+        "audioPlaylistId": "OLAK5uy_micro",
+    }
+    return album, videos
+
+
+def get_description(lines: int = DESCRIPTION_LINES) -> str:
+    """a description with track lists in several formats, separated by text"""
+    rng = random.Random(0)
+    rows: List[str] = []
+    seconds: int = 0
+    for i in range(lines):
+        if rng.random() < 0.05:
+            rows.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))))
+            continue
+        seconds += rng.randint(120, 420)
+        timestamp: str = f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+        title: str = " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+        rows.append(
+            rng.choice(
+                [f"{timestamp} - {title}", f"{i + 1}. {timestamp} {title}", f"{title} {timestamp}"]
+            )
+        )
+    return "\n".join(rows)
+
+
+class MicroPlaylist:
+    """stands in for AlbumPlaylist, so match_playlist_and_album does not need the network"""
+
+    videos: List[types.PlaylistEntry] = []
+
+    def __init__(self, url: str):
+        self.video_urls: List[str] = [
+            f"https://www.youtube.com/watch?v=micro{i:06}" for i in range(len(self.videos))
+        ]
+
+    def get_entry(self, video_url: str) -> types.PlaylistEntry:
+        return self.videos[int(video_url[-6:])]
+
+
+def bench_score_result() -> Callable[[], object]:
+    album, _ = get_album()
+    rng = random.Random(0)
+    searches = [(get_results(track, album, 20, rng), track) for track in album["tracks"]]
+    return lambda: [
+        score_result(result, track, album) for results, track in searches for result in results
+    ]
+
+
+def bench_pick_results() -> Callable[[], object]:
+    album, _ = get_album()
+    rng = random.Random(0)
+    searches = [(get_results(track, album, 20, rng), track, album) for track in album["tracks"]]
+    return lambda: pick_results(searches)
+
+
+def bench_merge_description() -> Callable[[], object]:
+    snippets: List[dict] = [{"text": line} for line in get_description().split("\n")]
+    return lambda: merge_description(snippets)
+
+
+def bench_match_playlist_and_album() -> Callable[[], object]:
+    album, videos = get_album()
+    MicroPlaylist.videos = videos
+
+    def run() -> object:
+        live = process.util.AlbumPlaylist
+        process.util.AlbumPlaylist = MicroPlaylist
+        try:
+            return match_playlist_and_album(album)
+        finally:
+            process.util.AlbumPlaylist = live
+
+    return run
+
+
+def bench_align_tracks() -> Callable[[], object]:
+    album, videos = get_album()
+    scores = score_matrix(album["tracks"], videos)
+    return lambda: align_tracks(scores)
+
+
+def bench_for_ffmpeg(mp3: bool) -> Callable[[], Callable[[], object]]:
+    def setup() -> Callable[[], object]:
+        album, _ = get_album()
+
+        def run() -> object:
+            types.Options.mp3 = mp3
+            return [
+                Metadata(
+                    track["title"],
+                    "Artist",
+                    album["title"],
+                    album["year"],
+                    i + 1,
+                    list(track["artists"]),
+                ).for_ffmpeg()
+                for i, track in enumerate(album["tracks"])
+            ]
+
+        return run
+
+    return setup
+
+
+def bench_find_track_information() -> Callable[[], object]:
+    description: str = get_description()
+    return lambda: find_track_information(description)
+
+
+def bench_row_regex() -> Callable[[], object]:
+    rows: List[str] = get_description().split("\n")
+    return lambda: [ROW_REGEX.match(row) for row in rows]
+
+
+# name: function returning the function to measure
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {
+    "score_result": bench_score_result,
+    "pick_results": bench_pick_results,
+    "merge_description": bench_merge_description,
+    "match_playlist_and_album": bench_match_playlist_and_album,
+    "align_tracks": bench_align_tracks,
+    "for_ffmpeg_opus": bench_for_ffmpeg(False),
+    "for_ffmpeg_mp3": bench_for_ffmpeg(True),
+    "find_track_information": bench_find_track_information,
+    "row_regex": bench_row_regex,
+}
+
+
+def measure(function: Callable[[], object]) -> float:
+    """:return: the fastest time of a call in seconds"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro benchmarks with stored baselines")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default: all")
+    parser.add_argument("--update", action="store_true", help="store the results as baselines")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.5,
+        help="relative slowdown reported as regression, default: 0.5",
+    )
+    return parser.parse_args()
+
+
+def run(names: List[str], update: bool, tolerance: float) -> bool:
+    """:return: whether no benchmark regressed"""
+    unknown: List[str] = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"unknown benchmarks: {', '.join(unknown)}")
+    baselines: Dict[str, float] = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    mp3: bool = getattr(types.Options, "mp3", False)
+    regressions: List[str] = []
+    print(f"{'benchmark':>24} {'ms':>10} {'baseline':>10} {'change':>8}")
+    for name in names or BENCHMARKS:
+        seconds: float = measure(BENCHMARKS[name]())
+        baseline = baselines.get(name)
+        change: str = ""
+        if baseline:
+            change = f"{seconds / baseline - 1:+.1%}"
+            if seconds > baseline * (1 + tolerance):
+                regressions.append(name)
+                change += " !"
+        baseline_ms: str = f"{baseline * 1000:.3f}" if baseline else "-"
+        print(f"{name:>24} {seconds * 1000:>10.3f} {baseline_ms:>10} {change:>8}")
+        if update:
+            baselines[name] = seconds
+    types.Options.mp3 = mp3
+    if update:
+        BASELINES.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+    return not regressions
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(0 if run(args.names, args.update, args.tolerance) else 1)
@@ -0,0 +1,353 @@
+#! /usr/bin/env python
+"""
+Runs process_artists (or the daemon loops) against local stand-ins for
+ytmusicapi, pytubefix and youtube-search-python, serving a synthetic catalogue
+and generated audio files, and reports throughput and resource usage.
+Requires ffmpeg, but no network.
+
+usage: python -m benchmark.offline [-h] [--artists N] [--albums N] [--tracks N] ...
+"""
+
+import argparse
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import daemon
+import process.album
+import process.artist
+import process.track
+import process.util
+from process.combined import process_artists
+from util import types, database, metrics
+
+
+class Settings:
+    artists: int
+    albums: int
+    tracks: int
+    track_seconds: int
+    latency: float
+    bandwidth: float
+    threads: int
+    stream_analysis: bool
+    daemon: Optional[float]
+    keep: bool
+
+
+class Latency:
+    def __init__(self, settings: Settings):
+        self.latency: float = settings.latency
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def thumbnails(name: str) -> list[types.Thumbnail]:
+    return [{"url": f"https://example.invalid/{name}=w544-h544", "width": 544, "height": 544}]
+
+
+class FakeYTMusic(Latency):
+    """serves a catalogue of settings.artists artists with settings.albums albums each"""
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings)
+        self.settings: Settings = settings
+
+    def get_artist(self, channel_id: str) -> types.Artist:
+        self.wait()
+        a: int = int(channel_id.removeprefix("UCbench"))
+        albums: list[types.AlbumResult] = [
+            {
+                "title": f"Album {a}-{b}",
+                "year": "2020",
+                "browseId": f"MPREb_bench_{a}_{b}",
+                "thumbnails": thumbnails(f"album{a}-{b}"),
+            }
+            for b in range(self.settings.albums)
+        ]
+        return {
+            "topic_channel_id": channel_id,
+            "description": f"Benchmark artist {a}",
+            "views": "0 views",
+            "name": f"Artist {a}",
+            "channelId": channel_id,
+            "thumbnails": thumbnails(f"artist{a}"),
+            "albums": {"browseId": None, "results": albums, "params": None},
+            "singles": {"browseId": None, "results": [], "params": None},
+        }
+
+    def get_artist_albums(self, browse_id: str, params: str) -> list:
+        self.wait()
+        return []
+
+    def get_album(self, browse_id: str) -> types.Album:
+        self.wait()
+        a, b = (int(i) for i in browse_id.removeprefix("MPREb_bench_").split("_"))
+        artists: list[types.AlbumArtist] = [{"name": f"Artist {a}", "id": f"UCbench{a:04}"}]
+        seconds: int = self.settings.track_seconds
+        return {
+            "title": f"Album {a}-{b}",
+            "thumbnails": thumbnails(f"album{a}-{b}"),
+            "artists": artists,
+            "year": "2020",
+            "trackCount": self.settings.tracks,
+            "duration": "...",
+            "duration_seconds": seconds * self.settings.tracks,
+            "tracks": [
+                {
+                    "videoId": f"bench_{a}_{b}_{t}",
+                    "title": f"Track {t}",
+                    "artists": artists,
+                    "album": f"Album {a}-{b}",
+                    "duration": f"{seconds // 60}:{seconds % 60:02}",
+                    "duration_seconds": seconds,
+                    "thumbnails": None,
+                    "isAvailable": True,
+                    "isExplicit": False,
+                }
+                for t in range(self.settings.tracks)
+            ],
+            "audioPlaylistId": f"OLAK5uy_bench_{a}_{b}",
+        }
+
+
+class FakeSearch(Latency):
+    """stands in for ChannelsSearch, CustomSearch and VideosSearch"""
+
+    settings: Settings
+
+    def __init__(self, query: str, *_):
+        super().__init__(self.settings)
+        self.wait()
+        self.query: str = query
+        self.responseSource: list = []
+
+    def result(self) -> dict:
+        return {"result": [{"title": self.query, "id": f"topic {self.query}"}]}
+
+
+class FakePlaylist(Latency):
+    settings: Settings
+
+    def __init__(self, url: str):
+        super().__init__(self.settings)
+        self.playlist_id: str = url.split("list=")[-1]
+
+    @property
+    def video_urls(self) -> list[str]:
+        self.wait()
+        a, b = self.playlist_id.removeprefix("OLAK5uy_bench_").split("_")
+        return [
+            f"https://www.youtube.com/watch?v=bench_{a}_{b}_{t}"
+            for t in range(self.settings.tracks)
+        ]
+
+    def get_entry(self, video_url: str) -> types.PlaylistEntry:
+        return {"title": None, "duration_seconds": None}
+
+
+class FakeStream:
+    itag: int = 251
+    bitrate: int = 160_000
+
+    def __init__(self, video: "FakeYouTube"):
+        self.video: FakeYouTube = video
+
+    def download(self, output_path: str, filename_prefix: str) -> str:
+        path: Path = Path(output_path, f"{filename_prefix}{self.video.video_id}.webm")
+        source: bytes = self.video.settings_audio.read_bytes()
+        chunk_size: int = 64 * 1024
+        with open(path, "wb") as f:
+            for i in range(0, len(source), chunk_size):
+                chunk: bytes = source[i:i + chunk_size]
+                if self.video.settings.bandwidth:
+                    time.sleep(len(chunk) / self.video.settings.bandwidth)
+                f.write(chunk)
+                if self.video.on_progress:
+                    self.video.on_progress(self, chunk, len(source) - i - len(chunk))
+        return str(path)
+
+
+class FakeStreamQuery:
+    def __init__(self, video: "FakeYouTube"):
+        self.video: FakeYouTube = video
+
+    def get_audio_only(self, subtype: Optional[str] = None) -> Optional[FakeStream]:
+        return FakeStream(self.video) if subtype in (None, "webm") else None
+
+
+class FakeYouTube(Latency):
+    settings: Settings
+    settings_audio: Path
+
+    def __init__(self, url: str):
+        super().__init__(self.settings)
+        self.wait()
+        self.video_id: str = url.split("v=")[-1]
+        self.visitor_data: str = "..."
+        self.streams = FakeStreamQuery(self)
+        self.on_progress: Optional[Callable] = None
+        self.streaming_data: dict = {
+            "adaptiveFormats": [
+                {"itag": 251, "audioSampleRate": "48000", "averageBitrate": 130_000}
+            ]
+        }
+
+    def register_on_progress_callback(self, callback: Callable):
+        self.on_progress = callback
+
+
+def fake_fetch_cover(url: str, path: Path):
+    shutil.copyfile(FakeYouTube.settings_audio.with_name("cover.jpg"), path)
+
+
+def generate_audio(directory: Path, seconds: int) -> Path:
+    """:return: the generated audio file, with a generated cover.jpg next to it"""
+    path: Path = directory.joinpath("source.webm")
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}:sample_rate=48000",
+            "-ac", "2", "-c:a", "libopus", "-b:a", "128k", str(path),
+        ],
+        check=True,
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", "color=c=blue:s=1200x1200", "-frames:v", "1",
+            str(directory.joinpath("cover.jpg")),
+        ],
+        check=True,
+    )
+    return path
+
+
+def install_stand_ins(settings: Settings, audio: Path):
+    process.util.ytmusic = FakeYTMusic(settings)
+    FakeSearch.settings = settings
+    FakePlaylist.settings = settings
+    FakeYouTube.settings = settings
+    FakeYouTube.settings_audio = audio
+    process.util.VideosSearch = FakeSearch
+    process.util.ChannelsSearch = FakeSearch
+    process.util.CustomSearch = FakeSearch
+    process.util.AlbumPlaylist = FakePlaylist
+    process.util.YouTube = FakeYouTube
+    process.track.YouTube = FakeYouTube
+    process.album.fetch_cover = fake_fetch_cover
+
+
+def run_daemon(destination: Path, settings: Settings):
+    arguments = daemon.Arguments()
+    arguments.destination = destination
+    arguments.artist_iteration_time = 0
+    arguments.album_iteration_time = 0
+    arguments.log_file = destination.joinpath("daemon.log")
+    artists = daemon.UpdateArtist(arguments)
+    albums = daemon.UpdateAlbum(arguments)
+    artists.daemon = albums.daemon = True
+    artists.start()
+    albums.start()
+    time.sleep(settings.daemon)
+    artists.is_running = albums.is_running = False
+
+
+def get_cpu_seconds() -> float:
+    usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    return sum(u.ru_utime + u.ru_stime for u in usage)
+
+
+def run(settings: Settings) -> dict:
+    directory: Path = Path(tempfile.mkdtemp(prefix="mcd-benchmark-"))
+    try:
+        audio: Path = generate_audio(directory, settings.track_seconds)
+        destination: Path = directory.joinpath("library")
+        destination.mkdir()
+        install_stand_ins(settings, audio)
+        types.Options.processing_threads = settings.threads
+        types.Options.background = True
+        types.Options.album_only = False
+        types.Options.mp3 = False
+        types.Options.no_singles = False
+        types.Options.stream_analysis = settings.stream_analysis
+        if settings.daemon:
+            daemon.init(destination)
+        else:
+            database.init(destination.joinpath("music-channel-downloader.db"))
+        channels: list[tuple[str, bool]] = [
+            (f"UCbench{a:04}", False) for a in range(settings.artists)
+        ]
+        results: types.ResultTuple = ([], {}, [])
+        cpu_start: float = get_cpu_seconds()
+        start: float = time.perf_counter()
+        if settings.daemon:
+            # the daemon only updates artists and albums already in the library
+            albums: list[process.artist.AlbumInput] = []
+            for channel_id, no_singles in channels:
+                process.artist.process_artist(channel_id, destination, albums, no_singles)
+            for album, artist, _ in albums:
+                process.album.insert_album(album, artist)
+            run_daemon(destination, settings)
+        else:
+            process_artists(channels, destination, results)
+        duration: float = time.perf_counter() - start
+        cpu: float = get_cpu_seconds() - cpu_start
+        snapshot: dict = metrics.snapshot()
+        done: int = int(snapshot["counters"].get("tracks_done", 0))
+        db_writes: dict = snapshot["stages"].get("db_write", {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+        return {
+            "tracks": done,
+            "errors": len(results[2]),
+            "seconds": duration,
+            "tracks_per_minute": done / duration * 60 if duration else 0.0,
+            "cpu_seconds_per_track": cpu / done if done else None,
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "peak_child_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+            "db_writes": db_writes["count"],
+            "db_write_mean_ms": db_writes["seconds"] / db_writes["count"] * 1000 if db_writes["count"] else 0.0,
+            "db_write_max_ms": db_writes["max_seconds"] * 1000,
+            "stages": snapshot["stages"],
+        }
+    finally:
+        if not settings.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_args() -> Settings:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark")
+    parser.add_argument("--artists", default=2, type=int, help="default: 2")
+    parser.add_argument("--albums", default=2, type=int, help="albums per artist, default: 2")
+    parser.add_argument("--tracks", default=6, type=int, help="tracks per album, default: 6")
+    parser.add_argument("--track-seconds", default=30, type=int, help="default: 30")
+    parser.add_argument(
+        "--latency", default=0.05, type=float, help="seconds per request, default: 0.05"
+    )
+    parser.add_argument(
+        "--bandwidth", default=2_000_000, type=float,
+        help="download bytes per second and track, 0 for unlimited, default: 2000000",
+    )
+    parser.add_argument("--threads", "-t", default=4, type=int, help="default: 4")
+    parser.add_argument("--stream-analysis", action="store_true")
+    parser.add_argument(
+        "--daemon", type=float, help="run the daemon loops for this many seconds instead"
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the generated library")
+    return parser.parse_args(namespace=Settings())
+
+
+if __name__ == "__main__":
+    report: dict = run(parse_args())
+    stages: dict = report.pop("stages")
+    print(json.dumps(report, indent=2))
+    print(f"{'stage':>28} {'count':>7} {'total s':>9} {'mean ms':>9}")
+    for stage, values in sorted(stages.items()):
+        mean: float = values["seconds"] / values["count"] * 1000
+        print(f"{stage:>28} {values['count']:>7} {values['seconds']:>9.2f} {mean:>9.1f}")
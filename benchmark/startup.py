@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+"""
+Measures the startup time of main.py, which is run from cron for many small
+libraries, each in a new interpreter.
+
+usage: python -m benchmark.startup [runs]
+"""
+
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+ROOT: Path = Path(__file__).parent.parent
+
+
+def measure(arguments: List[str], runs: int) -> float:
+    """:return: the median wall time of running the interpreter with the arguments"""
+    durations: List[float] = []
+    for _ in range(runs):
+        start: float = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, check=True, capture_output=True)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def slowest_imports(module: str, count: int = 10) -> List[tuple[int, str]]:
+    """:return: the cumulative import time in µs and name of the slowest imports of a module"""
+    output: str = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stderr
+    imports: List[tuple[int, str]] = []
+    children: List[tuple[int, str]] = []
+    # imports are listed after their own imports, indented by two spaces per level
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        depth: int = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                imports = children
+            children = []
+    return sorted(imports, reverse=True)[:count]
+
+
+def run(runs: int):
+    with tempfile.TemporaryDirectory() as library:
+        cases: List[tuple[str, List[str]]] = [
+            ("interpreter", ["-c", "pass"]),
+            ("import main", ["-c", "import main"]),
+            ("import process.combined", ["-c", "import process.combined"]),
+            ("empty library run", ["main.py", "-b", library]),
+        ]
+        for name, arguments in cases:
+            print(f"{name:>24}: {measure(arguments, runs) * 1000:8.1f} ms")
+    print("slowest imports of main:")
+    for cumulative, name in slowest_imports("main"):
+        print(f"{name:>24}: {cumulative / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
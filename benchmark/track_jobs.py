@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+"""
+Measures the memory kept alive by queued tracks of a synthetic run, once as
+tuples referencing the complete ytmusicapi albums and artists (as before),
+once as TrackJob records.
+Then runs process_artists against the stand-ins of benchmark/offline.py, and
+measures the memory retained when the track phase starts, with and without
+freeing the memoized albums.
+
+usage: python -m benchmark.track_jobs [track count]
+"""
+
+import gc
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable
+
+import process.combined
+import process.util
+from benchmark.offline import Settings, install_stand_ins
+from util import database, types
+
+TRACKS_PER_ALBUM: int = 12
+ALBUMS_PER_ARTIST: int = 20
+
+
+def get_thumbnails(name: str) -> list[types.Thumbnail]:
+    return [
+        {"url": f"https://lh3.googleusercontent.com/{name}=w{size}-h{size}", "width": size, "height": size}
+        for size in (60, 120, 226, 544)
+    ]
+
+
+def get_artist(i: int) -> types.Artist:
+    return {
+        "name": f"Artist {i}",
+        "channelId": f"UC{i:022}",
+        "topic_channel_id": f"UC{i:022}",
+        "description": f"Description of artist {i} " * 40,
+        "views": "1,234,567 views",
+        "thumbnails": get_thumbnails(f"artist{i}"),
+        "albums": {"browseId": None, "results": [], "params": None},
+        "singles": {"browseId": None, "results": [], "params": None},
+        "path": f"Artist {i}",
+    }
+
+
+def get_album(i: int, artist: types.Artist) -> types.Album:
+    album_artists: list[types.AlbumArtist] = [{"name": artist["name"], "id": artist["channelId"]}]
+    return {
+        "title": f"Album {i}",
+        "thumbnails": get_thumbnails(f"album{i}"),
+        "artists": album_artists,
+        "year": "2020",
+        "trackCount": TRACKS_PER_ALBUM,
+        "duration": "48 minutes",
+        "duration_seconds": 2880,
+        "description": f"Description of album {i} " * 60,
+        "tracks": [
+            {
+                "videoId": f"{i:06}{j:05}",
+                "title": f"Track {j} of album {i}",
+                "artists": list(album_artists),
+                "album": f"Album {i}",
+                "duration": "4:00",
+                "duration_seconds": 240,
+                "thumbnails": get_thumbnails(f"track{i}-{j}"),
+                "isAvailable": True,
+                "isExplicit": False,
+                "likeStatus": "INDIFFERENT",
+                "feedbackTokens": {"add": f"token{i}{j}" * 4, "remove": f"token{j}{i}" * 4},
+            }
+            for j in range(TRACKS_PER_ALBUM)
+        ],
+        "audioPlaylistId": f"OLAK5uy_{i:033}",
+        "browseId": f"MPREb_{i:011}",
+        "path": f"Album {i}",
+    }
+
+
+def as_tuple(i: int, album: types.Album, artist: types.Artist, destination: Path, alid: int) -> Any:
+    return i, album, artist, destination, alid, f"https://www.youtube.com/watch?v={album['tracks'][i]['videoId']}"
+
+
+def as_job(i: int, album: types.Album, artist: types.Artist, destination: Path, alid: int) -> Any:
+    return types.TrackJob.from_ytmusic(
+        i, album, artist, destination, alid, f"https://www.youtube.com/watch?v={album['tracks'][i]['videoId']}"
+    )
+
+
+def measure(track_count: int, build: Callable[..., Any]) -> tuple[int, int]:
+    """:return: memory retained by the queue and peak memory, in bytes"""
+    gc.collect()
+    tracemalloc.start()
+    queue: list[Any] = []
+    album_count: int = track_count // TRACKS_PER_ALBUM
+    artist: types.Artist = get_artist(0)
+    for i in range(album_count):
+        if i % ALBUMS_PER_ARTIST == 0:
+            artist = get_artist(i // ALBUMS_PER_ARTIST)
+        album: types.Album = get_album(i, artist)
+        destination: Path = Path("/library", artist["path"], album["path"])
+        queue.extend(build(j, album, artist, destination, i) for j in range(TRACKS_PER_ALBUM))
+    del album, artist
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return retained, peak
+
+
+def get_settings(track_count: int) -> Settings:
+    settings = Settings()
+    settings.albums = ALBUMS_PER_ARTIST
+    settings.tracks = TRACKS_PER_ALBUM
+    settings.artists = max(1, track_count // (ALBUMS_PER_ARTIST * TRACKS_PER_ALBUM))
+    settings.track_seconds = 240
+    settings.latency = 0
+    settings.bandwidth = 0
+    return settings
+
+
+def measure_pipeline(track_count: int, keep_albums: bool) -> tuple[int, int, int]:
+    """
+    Runs process_album for every album, up to the start of process_tracks
+    :param keep_albums: keep the memoized albums, as before they were freed
+    :return: queued tracks, memory retained when the track phase starts and peak memory, in bytes
+    """
+    settings: Settings = get_settings(track_count)
+    measured: list[tuple[int, int, int]] = []
+
+    def process_tracks(tracks: list[types.TrackJob], *_):
+        gc.collect()
+        measured.append((len(tracks), *tracemalloc.get_traced_memory()))
+
+    clear: Callable[[], None] = process.util.album_flight.clear
+    with tempfile.TemporaryDirectory() as tmp:
+        destination = Path(tmp)
+        # fetching covers copies the one next to the (never downloaded) audio
+        destination.joinpath("cover.jpg").write_bytes(b"\xff\xd8\xff\xd9")
+        install_stand_ins(settings, destination.joinpath("source.webm"))
+        database.init(destination.joinpath("music-channel-downloader.db"))
+        process.combined.process_tracks = process_tracks
+        if keep_albums:
+            process.util.album_flight.clear = lambda: None
+        channels = [(f"UCbench{a:04}", True) for a in range(settings.artists)]
+        gc.collect()
+        tracemalloc.start()
+        try:
+            process.combined.process_artists(channels, destination.joinpath("library"), ([], {}, []))
+        finally:
+            tracemalloc.stop()
+            process.util.album_flight.clear = clear
+            clear()
+            database.get_connection().close()
+            database.thread_local.connection = None
+    return measured[0] if measured else (0, 0, 0)
+
+
+def run(track_count: int):
+    for name, build in (("tuples", as_tuple), ("TrackJob", as_job)):
+        retained, peak = measure(track_count, build)
+        print(
+            f"{name:>8}: {retained / 2**20:8.1f} MiB retained, {peak / 2**20:8.1f} MiB peak"
+            f" for {track_count} tracks ({retained / track_count:.0f} bytes per track)"
+        )
+    types.Options.background = True
+    types.Options.album_only = False
+    types.Options.mp3 = False
+    types.Options.processing_threads = 1
+    for name, keep_albums in (("memoized albums", True), ("freed albums", False)):
+        queued, retained, peak = measure_pipeline(track_count, keep_albums)
+        print(
+            f"{name:>16}: {retained / 2**20:8.1f} MiB retained at the track phase,"
+            f" {peak / 2**20:8.1f} MiB peak for {queued} queued tracks"
+        )
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,96 @@
+#! /usr/bin/env python
+"""
+Compares scoring search results one by one with score_result against the
+batch scorer, using the tracks of test/test_video_search.py and synthetic
+search results, or with --recorded the search results recorded by that test
+(sent live, until they have been recorded).
+
+usage: python -m benchmark.video_scoring [results per track | --recorded]
+"""
+
+import random
+import sys
+import timeit
+from typing import List, Optional
+
+from process.track import pick_results, score_result, get_search_query
+from process.util import video_search
+from test import use_cassette
+from test.test_video_search import VIDEOS, get_track_album_artist
+from util import types
+
+
+def get_results(
+    track: types.Track, album: types.Album, count: int, rng: random.Random
+) -> List[types.YoutubeSearchVideoResult]:
+    results: List[types.YoutubeSearchVideoResult] = []
+    for i in range(count):
+        title: str = track["title"]
+        if rng.random() < 0.7:
+            title = f'{title} {rng.choice(["(Live)", "(Official Video)", "Cover", "Lyrics"])}'
+        description: str = (
+            f'Provided to YouTube by Label {title} · Artist {album["title"]} '
+            f'℗ {rng.choice(["2001", "2017", "2021"])} Label Released on: ...'
+        )
+        results.append(
+            {
+                "id": f"video{i:06}",
+                "title": title,
+                "publishedTime": "...",
+                "duration": rng.choice([track["duration"], "3:00", "4:12"]),
+                "thumbnails": [],
+                "channel": {"name": "...", "id": "...", "thumbnails": [], "link": "..."},
+                "descriptionSnippet": [
+                    {"text": description[i:i + 40]} for i in range(0, len(description), 40)
+                ],
+                "link": "...",
+            }
+        )
+    return results
+
+
+def sorted_pick(searches) -> List[Optional[str]]:
+    """the way search_and_pick used to pick results, for comparison"""
+    picks: List[Optional[str]] = []
+    for results, track, album in searches:
+        scored = [score_result(result, track, album) for result in results]
+        scored.sort(key=lambda x: -x[0])
+        picks.append(scored[0][1] if scored and scored[0][0] > 1 else None)
+    return picks
+
+
+def get_recorded_searches():
+    searches = []
+    with use_cassette("video_search.json"):
+        for video_data in VIDEOS:
+            track, album, artist = get_track_album_artist(*video_data)
+            searches.append((video_search(get_search_query(track, album, artist)), track, album))
+    return searches
+
+
+def get_synthetic_searches(results_per_track: int):
+    rng = random.Random(0)
+    searches = []
+    for video_data in VIDEOS:
+        track, album, _ = get_track_album_artist(*video_data)
+        searches.append((get_results(track, album, results_per_track, rng), track, album))
+    return searches
+
+
+def run(searches):
+    assert sorted_pick(searches) == pick_results(searches), "batch scorer differs"
+    repeat: int = 20
+    for name, method in (("per result", sorted_pick), ("batch", pick_results)):
+        duration: float = timeit.timeit(lambda: method(searches), number=repeat)
+        results: int = sum(len(results) for results, _, _ in searches)
+        print(
+            f"{name:>10}: {duration / repeat * 1000:8.2f} ms for {len(searches)} tracks"
+            f" with {results} results"
+        )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--recorded"]:
+        run(get_recorded_searches())
+    else:
+        run(get_synthetic_searches(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
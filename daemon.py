@@ -1,5 +1,6 @@
 import argparse
-from util import types, database
+from util import types, database, metrics, status
+from util.profiler import SamplingProfiler
 import os
 from pathlib import Path
 from typing import Optional
@@ -7,7 +8,7 @@ from util.io import join_and_create
 import json
 import threading
 import time
-from process import artist, album, combined
+from process import artist, album, combined, journal, util
 from util.io import always_gen
 from concurrent.futures import ThreadPoolExecutor
 import traceback
@@ -19,13 +20,22 @@ class Arguments:
     log_file: Optional[Path]
     mp3: bool
     no_singles: bool
+    stream_analysis: bool
+    search_cache_ttl: int
+    cover_size: int
+    embed_existing_covers: bool
+    encoder_profile: str
+    metrics_file: Optional[Path]
+    profile: Optional[Path]
+    profile_interval: float
+    status_port: Optional[int]
     artist_iteration_time: int
     album_iteration_time: int
 
 
 class UpdateArtist(threading.Thread):
     def __init__(self, arguments: Arguments):
-        super().__init__()
+        super().__init__(name="UpdateArtist")
         self.iteration_time: int = arguments.artist_iteration_time
         self.destination: Path = arguments.destination
         self.is_running: bool = True
@@ -33,13 +43,18 @@ class UpdateArtist(threading.Thread):
     def do_update(self, channel_id: str):
         print(f"Updating {channel_id}")
         albums: list[artist.AlbumInput] = []
-        artist.process_artist(channel_id, self.destination, albums, False)
+        # known albums are updated by UpdateAlbum
+        fingerprint: str = artist.process_artist(
+            channel_id, self.destination, albums, False, album_only=True
+        )
         for current_album in albums:
             album.insert_album(current_album[0], current_album[1])
+        database.update_artist_fingerprint(channel_id, fingerprint)
 
     def run(self):
         while self.is_running:
             try:
+                status.wait_if_paused()
                 start_time: float = time.time()
                 if aid := database.get_least_recently_updated_artist():
                     try:
@@ -55,22 +70,25 @@ class UpdateArtist(threading.Thread):
 
 class UpdateAlbum(threading.Thread):
     def __init__(self, arguments: Arguments):
-        super().__init__()
+        super().__init__(name="UpdateAlbum")
         self.iteration_time: int = arguments.album_iteration_time
         self.destination: Path = arguments.destination
         self.log_file: Path = arguments.log_file
         self.is_running: bool = True
 
     def do_update(self, alid: int, results: types.ResultTuple):
-        tracks: list[album.TrackInput] = []
+        tracks: list[types.TrackJob] = []
         current_artist, current_album = album.get_from_alid(alid)
         print(f"Updating {current_album}")
         artist_destination: Path = join_and_create(self.destination, current_artist["path"])
         album.process_album(current_album, current_artist, artist_destination, tracks)
+        self.process_tracks(tracks, results)
+
+    def process_tracks(self, tracks: list[types.TrackJob], results: types.ResultTuple):
         if not tracks:
             return
         output_gen = always_gen(len(tracks), results)
-        ex = ThreadPoolExecutor(types.Options.processing_threads)
+        ex = ThreadPoolExecutor(types.Options.processing_threads, thread_name_prefix="track")
         items = ex.map(
             combined.process_track_interop,
             tracks,
@@ -101,9 +119,23 @@ class UpdateAlbum(threading.Thread):
         }
         results[2].append(error)
 
+    def resume(self):
+        """finishes the tracks, that have been interrupted by the last shutdown"""
+        results: types.ResultTuple = ([], {}, [])
+        tracks: list[types.TrackJob] = journal.resume_tracks()
+        if tracks:
+            print(f"Resuming {len(tracks)} tracks")
+            self.process_tracks(tracks, results)
+            self.log_result(results, 1)
+
     def run(self):
+        try:
+            self.resume()
+        except:
+            print(traceback.format_exc())
         while self.is_running:
             try:
+                status.wait_if_paused()
                 start_time: float = time.time()
                 if alid := database.get_least_recently_updated_album():
                     infinite = False
@@ -144,6 +176,38 @@ def parse_args() -> Arguments:
         action="store_true",
         help="Do not download singles for the supplied artists",
     )
+    parser.add_argument(
+        "--stream-analysis",
+        action="store_true",
+        help="Measure the loudness while downloading, instead of afterward",
+    )
+    parser.add_argument(
+        "--search-cache-ttl",
+        default=types.Options.search_cache_ttl,
+        type=int,
+        help="For how many seconds search results are reused, 0 disables the cache,"
+        f" default: {types.Options.search_cache_ttl}",
+    )
+    parser.add_argument(
+        "--cover-size",
+        default=types.Options.cover_size,
+        type=int,
+        help="Maximum width and height of the cover embedded into every track in pixels,"
+        f" 0 disables embedding, default: {types.Options.cover_size}",
+    )
+    parser.add_argument(
+        "--embed-existing-covers",
+        action="store_true",
+        help="Also embed the cover into tracks downloaded before, which rewrites them once",
+    )
+    parser.add_argument(
+        "--encoder-profile",
+        default=types.Options.encoder_profile,
+        choices=list(types.ENCODER_PROFILES),
+        help="Trade encoding speed for resampling and encoder quality,"
+        " see benchmark/encoder_profiles.py, default: "
+        f"{types.Options.encoder_profile}",
+    )
     parser.add_argument(
         "--artist-iteration-time",
         "-a",
@@ -164,6 +228,29 @@ def parse_args() -> Arguments:
         type=Path,
         help="Optional log file path for updates",
     )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        help="Export timings and counters of all processing stages to this file,"
+        " as json if it ends with .json, otherwise in the prometheus text format",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Sample the stacks of all threads, and write them as collapsed stacks to this file."
+        " SIGUSR1 pauses and resumes sampling",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        default=0.01,
+        type=float,
+        help="Seconds between two stack samples, default: 0.01",
+    )
+    parser.add_argument(
+        "--status-port",
+        type=int,
+        help="Serve the status and control api on this port of localhost",
+    )
     parser.add_argument(
         "destination",
         metavar="D",
@@ -174,18 +261,32 @@ def parse_args() -> Arguments:
     types.Options.processing_threads = args.threads
     types.Options.no_singles = args.no_singles
     types.Options.mp3 = args.mp3
+    types.Options.stream_analysis = args.stream_analysis
+    types.Options.search_cache_ttl = args.search_cache_ttl
+    types.Options.cover_size = args.cover_size
+    types.Options.embed_existing_covers = args.embed_existing_covers
+    types.Options.encoder_profile = args.encoder_profile
     types.Options.album_only = False
     return args
 
 
 def init(destination: Path):
+    # albums are only shared within an update, without keeping them for weeks
+    util.album_flight.max_age = 60 * 60
     join_and_create(destination, ".")
     database.init(destination.joinpath("music-channel-downloader.db"))
     database.register_daemon()
 
 
-def process_args(args: types.Arguments):
+def process_args(args: Arguments):
     init(args.destination)
+    metrics.start_exporter(args.metrics_file)
+    status.start_server(args.status_port)
+    profiler: Optional[SamplingProfiler] = None
+    if args.profile:
+        profiler = SamplingProfiler(args.profile, args.profile_interval)
+        profiler.register_signal()
+        profiler.start()
     artists = UpdateArtist(args)
     albums = UpdateAlbum(args)
     artists.start()
@@ -197,6 +298,10 @@ def process_args(args: types.Arguments):
         database.unregister_daemon()
         artists.is_running = False
         albums.is_running = False
+        if args.metrics_file:
+            metrics.export(args.metrics_file)
+        if profiler:
+            profiler.stop()
 
 
 if __name__ == "__main__":
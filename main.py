@@ -2,18 +2,23 @@
 
 import argparse
 
-from process.combined import process_artists
-from process.util import ytmusic
-from util.io import join_and_create
+from util.io import join_and_create, EventList, EventDict
 from util.multiselect import multiselect
-from util import types, database
+from util import types, database, metrics
 from pathlib import Path
 import json
 import os
 
 
+# The process modules import pytubefix, ytmusicapi and the other clients, which
+# takes longer than runs without anything to do. They are imported on first use.
+
+
 def get_channel_id(name: str) -> str:
-    artists = ytmusic.search(name, filter="artists")
+    from process.util import get_ytmusic
+
+    with metrics.timer("ytmusic_search"):
+        artists = get_ytmusic().search(name, filter="artists")
     if len(artists) > 1:
         selections = [f'{artist["artist"]}' for artist in artists]
         selected = multiselect(
@@ -32,10 +37,20 @@ def init(destination: Path):
     database.init(destination.joinpath("music-channel-downloader.db"))
 
 
+def process_channels(
+    channels: list[tuple[str, bool]], destination: Path, results: types.ResultTuple
+):
+    from process.combined import process_artists
+
+    return process_artists(channels, destination, results)
+
+
 def maintenance(destination: Path, results: types.ResultTuple):
     init(destination)
     channels = database.get_artists()
-    return process_artists(channels, destination, results)
+    if not channels and not database.count_jobs():
+        return
+    return process_channels(channels, destination, results)
 
 
 def add_channels_from_names(
@@ -43,7 +58,7 @@ def add_channels_from_names(
 ):
     init(destination)
     channels = [(get_channel_id(name), types.Options.no_singles) for name in names]
-    return process_artists(channels, destination, results)
+    return process_channels(channels, destination, results)
 
 
 def add_channels_from_channel_ids(
@@ -51,7 +66,7 @@ def add_channels_from_channel_ids(
 ):
     init(destination)
     channels = [(channel_id, types.Options.no_singles) for channel_id in channel_ids]
-    return process_artists(channels, destination, results)
+    return process_channels(channels, destination, results)
 
 
 def parse_args() -> types.Arguments:
@@ -74,12 +89,23 @@ def parse_args() -> types.Arguments:
         action="store_true",
         help="Run in Background mode, only returning a final json",
     )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="In background mode, print a json line per track, album and error as soon"
+        " as it is done, instead of a final json",
+    )
     parser.add_argument(
         "--album-only",
         "-a",
         action="store_true",
         help="Only investigate unknown albums, do not check all individual tracks",
     )
+    parser.add_argument(
+        "--deep",
+        action="store_true",
+        help="Also check albums, where every track has already been downloaded",
+    )
     parser.add_argument(
         "--channel-id", "-c", type=str, nargs="*", help="Specify ChannelIds to check"
     )
@@ -91,6 +117,44 @@ def parse_args() -> types.Arguments:
         action="store_true",
         help="Do not download singles for the supplied artists",
     )
+    parser.add_argument(
+        "--stream-analysis",
+        action="store_true",
+        help="Measure the loudness while downloading, instead of afterward",
+    )
+    parser.add_argument(
+        "--search-cache-ttl",
+        default=types.Options.search_cache_ttl,
+        type=int,
+        help="For how many seconds search results are reused, 0 disables the cache,"
+        f" default: {types.Options.search_cache_ttl}",
+    )
+    parser.add_argument(
+        "--cover-size",
+        default=types.Options.cover_size,
+        type=int,
+        help="Maximum width and height of the cover embedded into every track in pixels,"
+        f" 0 disables embedding, default: {types.Options.cover_size}",
+    )
+    parser.add_argument(
+        "--embed-existing-covers",
+        action="store_true",
+        help="Also embed the cover into tracks downloaded before, which rewrites them once",
+    )
+    parser.add_argument(
+        "--encoder-profile",
+        default=types.Options.encoder_profile,
+        choices=list(types.ENCODER_PROFILES),
+        help="Trade encoding speed for resampling and encoder quality,"
+        " see benchmark/encoder_profiles.py, default: "
+        f"{types.Options.encoder_profile}",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        help="Export timings and counters of all processing stages to this file,"
+        " as json if it ends with .json, otherwise in the prometheus text format",
+    )
     parser.add_argument(
         "destination",
         metavar="D",
@@ -104,13 +168,22 @@ def parse_args() -> types.Arguments:
     types.Options.processing_threads = args.threads
     types.Options.background = args.background
     types.Options.album_only = args.album_only
+    types.Options.deep = args.deep
     types.Options.no_singles = args.no_singles
     types.Options.mp3 = args.mp3
+    types.Options.stream_analysis = args.stream_analysis
+    types.Options.search_cache_ttl = args.search_cache_ttl
+    types.Options.cover_size = args.cover_size
+    types.Options.embed_existing_covers = args.embed_existing_covers
+    types.Options.encoder_profile = args.encoder_profile
     return args
 
 
 def process_args(args: types.Arguments):
+    metrics.start_exporter(args.metrics_file)
     results: types.ResultTuple = ([], {}, [])
+    if args.background and args.ndjson:
+        results = (EventList("track"), EventDict("album"), EventList("error"))
     check_library: bool = True
     if args.name:
         add_channels_from_names(args.destination, args.name, results)
@@ -120,9 +193,11 @@ def process_args(args: types.Arguments):
         check_library = False
     if check_library:
         maintenance(args.destination, results)
+    if args.metrics_file:
+        metrics.export(args.metrics_file)
     tracks, albums, errors = results
     output: types.Result = {"tracks": tracks, "albums": albums, "errors": errors}
-    if args.background and (tracks or albums or errors):
+    if args.background and not args.ndjson and (tracks or albums or errors):
         print(json.dumps(output))
 
 
@@ -1,10 +1,16 @@
+import os
+from email.utils import formatdate
 from pathlib import Path
 from typing import Optional
-from urllib.request import urlretrieve
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-from process.util import ytmusic
-from util import types, database
-from util.io import join_and_create
+from process.util import get_ytmusic, get_album
+from util import types, database, metrics
+from util.cache import SingleFlight
+from util.convert_audio import Cover, Metadata, embed_cover, read_tags, scale_cover, write_tags
+from util.io import join_and_create, get_track_filename
+from .journal import queue_tracks
 from .util import match_playlist_and_album
 
 
@@ -12,9 +18,10 @@ def get_albums_for_artist(artist: types.Artist) -> Optional[list[types.AlbumResu
     if "albums" in artist:
         params: str = artist["albums"].get("params")
         if params:
-            param_result = ytmusic.get_artist_albums(
-                artist["albums"]["browseId"], params
-            )
+            with metrics.timer("ytmusic_get_artist_albums"):
+                param_result = get_ytmusic().get_artist_albums(
+                    artist["albums"]["browseId"], params
+                )
             if param_result:
                 return param_result
         return artist["albums"]["results"]
@@ -25,63 +32,194 @@ def get_singles_for_artist(artist: types.Artist) -> Optional[list[types.SingleRe
     if "singles" in artist:
         params: str = artist["singles"].get("params")
         if params:
-            param_result = ytmusic.get_artist_albums(
-                artist["singles"]["browseId"], params
-            )
+            with metrics.timer("ytmusic_get_artist_albums"):
+                param_result = get_ytmusic().get_artist_albums(
+                    artist["singles"]["browseId"], params
+                )
             if param_result:
                 return param_result
         return artist["singles"]["results"]
     return None
 
 
+# concurrent downloads of the same cover
+thumbnail_flight: SingleFlight = SingleFlight()
+# covers prepared for embedding, only needed while the tracks of their album are processed
+cover_flight: SingleFlight = SingleFlight(memoize=True, max_age=10 * 60)
+
+
+def fetch_cover(img_url: str, cover_path: Path):
+    """downloads the cover, unless it did not change since the last download"""
+    request = Request(img_url)
+    if cover_path.is_file():
+        request.add_header(
+            "If-Modified-Since", formatdate(cover_path.stat().st_mtime, usegmt=True)
+        )
+    try:
+        with metrics.timer("thumbnail"), urlopen(request) as response:
+            data: bytes = response.read()
+    except HTTPError as e:
+        if e.code == 304:
+            return
+        raise
+    tmp_path: Path = cover_path.with_name(f".{cover_path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, cover_path)
+
+
 def process_thumbnail(album: types.Album, album_destination: Path):
     cover_path: Path = album_destination.joinpath("cover.jpg")
-    if not cover_path.is_file():
-        img_url: str = album["thumbnails"][-1]["url"]
-        if "=" in img_url:
-            img_url = img_url.split("=")[0] + "=s0?imgmax=0"
-        urlretrieve(img_url, cover_path)
+    img_url: str = album["thumbnails"][-1]["url"]
+    if "=" in img_url:
+        img_url = img_url.split("=")[0] + "=s0?imgmax=0"
+    thumbnail_flight.do(cover_path, lambda: fetch_cover(img_url, cover_path))
     return cover_path
 
 
-TrackInput = tuple[int, types.Album, types.Artist, Path, int, Optional[str]]
+def get_cover_version(album_destination: Path) -> Optional[str]:
+    """
+    :return: identifies the cover of the album and the size it is embedded with,
+        None if there is none or embedding is disabled
+    """
+    if not types.Options.cover_size:
+        return None
+    try:
+        modified: float = album_destination.joinpath("cover.jpg").stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return f"{modified} {types.Options.cover_size}"
+
+
+def get_cover(album_destination: Path) -> Optional[Cover]:
+    """
+    :return: the cover of the album scaled down to Options.cover_size, prepared once
+        for all of its tracks, None if there is none or embedding is disabled
+    """
+    version: Optional[str] = get_cover_version(album_destination)
+    if not version:
+        return None
+    cover_path: Path = album_destination.joinpath("cover.jpg")
+
+    def prepare() -> Optional[Cover]:
+        data: Optional[bytes] = scale_cover(cover_path, types.Options.cover_size)
+        return Cover(data) if data else None
+
+    return cover_flight.do((cover_path, version), prepare)
 
 
 def get_from_alid(alid: int) -> tuple[types.Artist, types.Album]:
-    artist, album = database.get_album_artist(alid)
-    new_album: types.Album = ytmusic.get_album(album["browseId"])
-    new_album["browseId"] = album["browseId"]
-    new_album["path"] = album["path"]
-    return artist, album
+    """:return: the stored artist and album, process_album fetches the current album itself"""
+    return database.get_album_artist(alid)
 
 
 def insert_album(album: types.AlbumResult, artist: types.Artist) -> tuple[types.Album, int]:
     browse_id: str = album["browseId"]
-    album: types.Album = ytmusic.get_album(browse_id)
+    album: types.Album = get_album(browse_id)
     album["browseId"] = browse_id
     album["path"] = database.get_unique_album_path(album, artist)
     alid: int = database.insert_album(album, artist)
     return album, alid
 
 
+def get_stored_track_path(
+    album: types.Album,
+    artist_destination: Path,
+    track_id: int,
+    title: str,
+    track_path: Optional[Path],
+) -> Path:
+    """:return: the file of a downloaded track, also if it was inserted before files were stored"""
+    if track_path:
+        return track_path
+    # the file name uses the title at the time of the download
+    extension = "mp3" if types.Options.mp3 else "opus"
+    album_destination: Path = artist_destination.joinpath(album["path"])
+    return album_destination.joinpath(get_track_filename(track_id, title, extension))
+
+
+def embed_album_cover(album: types.Album, alid: int, artist_destination: Path):
+    """embeds the cover into the downloaded tracks, unless it already is in every one of them"""
+    album_destination: Path = artist_destination.joinpath(album["path"])
+    version: Optional[str] = get_cover_version(album_destination)
+    if not version or version == database.get_album_cover(alid):
+        return
+    cover: Optional[Cover] = get_cover(album_destination)
+    if not cover:
+        return
+    for _, track_id, title, track_path, _ in database.get_track_tags(alid).values():
+        track_path = get_stored_track_path(album, artist_destination, track_id, title, track_path)
+        # missing files are downloaded again, after an audit
+        if track_path.is_file() and not embed_cover(track_path, cover):
+            return
+    database.update_album_cover(alid, version)
+
+
+def retag_tracks(
+    album: types.Album, artist: types.Artist, alid: int, artist_destination: Path
+):
+    """rewrites the tags of downloaded tracks, whose metadata changed upstream"""
+    stored_tracks = database.get_track_tags(alid)
+    for i, track in enumerate(album["tracks"]):
+        video_id: str = database.get_video_id_for_track(track)
+        if video_id not in stored_tracks:
+            continue
+        tid, track_id, title, track_path, stored_tags = stored_tracks[video_id]
+        metadata: Metadata = Metadata.from_ytmusic(track, i + 1, album, artist)
+        tags: dict[str, str] = metadata.tags()
+        if tags == stored_tags:
+            continue
+        track_path = get_stored_track_path(album, artist_destination, track_id, title, track_path)
+        if stored_tags is None and metadata.matches_tags(read_tags(track_path)):
+            ...  # unknown, but already up to date
+        elif write_tags(track_path, metadata):
+            metrics.count("tracks_retagged")
+        else:
+            continue
+        database.update_track_tags(tid, tags)
+
+
 def process_album(
     album: types.AlbumResult,
     artist: types.Artist,
     artist_destination: Path,
-    tracks: list[TrackInput],
+    tracks: list[types.TrackJob],
 ):
     album, alid = insert_album(album, artist)
+    retag_tracks(album, artist, alid, artist_destination)
+    if types.Options.embed_existing_covers:
+        embed_album_cover(album, alid, artist_destination)
     db_tracks: list[str] = database.get_tracks_for_album(alid)
+    stored_track_count: int = database.get_album_track_count(alid)
+    if stored_track_count != album["trackCount"]:
+        database.update_album_track_count(alid, album["trackCount"])
+    elif len(db_tracks) >= stored_track_count and not types.Options.deep:
+        # every track has been downloaded, skip requesting the playlist
+        return
+    # tracks that failed recently, or for reasons that won't change soon
+    postponed: set[str] = set() if types.Options.deep else database.get_postponed_tracks(alid)
+    if all(
+        database.get_video_id_for_track(track) in postponed
+        or database.get_video_id_for_track(track) in db_tracks
+        for track in album["tracks"]
+    ):
+        return
     album_destination: Path = join_and_create(artist_destination, album["path"])
     video_urls = match_playlist_and_album(album)
-    found_any = False
+    new_tracks: list[types.TrackJob] = []
     for i in range(len(album["tracks"])):
         track: types.Track = album["tracks"][i]
         video_id: str = database.get_video_id_for_track(track)
-        if video_id not in db_tracks:
-            tracks.append(
-                (i, album, artist, album_destination, alid, video_urls[i])
+        if (
+            video_id not in db_tracks
+            and video_id not in postponed
+            # already queued, when resumed from the journal
+            and not database.get_job(alid, video_id)
+        ):
+            new_tracks.append(
+                types.TrackJob.from_ytmusic(
+                    i, album, artist, album_destination, alid, video_urls[i]
+                )
             )
-            found_any = True
-    if found_any:
+    queue_tracks(tracks, new_tracks)
+    if new_tracks:
         process_thumbnail(album, album_destination)
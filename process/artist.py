@@ -1,27 +1,37 @@
+from hashlib import sha1
 from pathlib import Path
+from typing import Optional
 
-from youtubesearchpython import ChannelsSearch, CustomSearch
-
-from process.util import ytmusic
+from process.util import get_ytmusic, channel_search, custom_search
 from process.album import get_albums_for_artist, get_singles_for_artist
 
-from util import types, database
+from util import types, database, metrics
 from util.io import join_and_create, bprint
 
 
 def get_topic_channel_id(artist: types.Artist) -> str:
     target: str = f'{artist["name"]} - Topic'
-    search = ChannelsSearch(target)
-    for channel in search.result()["result"]:
+    channels, original_params = channel_search(target)
+    for channel in channels:
         if channel["title"].lower() == target.lower():
             return channel["id"]
-    if search.responseSource and (alt := search.responseSource[0].get('showingResultsForRenderer')):
-        search = CustomSearch(target, alt['originalQueryEndpoint']['searchEndpoint']['params'])
-        for channel in search.result()["result"]:
+    if original_params:
+        for channel in custom_search(target, original_params):
             if channel["title"].lower() == target.lower():
                 return channel["id"]
 
 
+def get_release_fingerprint(artist: types.Artist, no_singles: bool) -> str:
+    """
+    Fingerprints the releases shown on the artist page. New releases are listed
+    first, so the fingerprint changes whenever the artist released something.
+    """
+    parts: list[str] = ["singles" if not no_singles else "no singles"]
+    for kind in ("albums", "singles"):
+        parts.extend(release["browseId"] for release in artist.get(kind, {}).get("results", []))
+    return sha1("\n".join(parts).encode()).hexdigest()[:16]
+
+
 AlbumInput = tuple[types.AlbumResult, types.Artist, Path]
 
 
@@ -30,8 +40,21 @@ def process_artist(
     destination: Path,
     global_albums: list[AlbumInput],
     no_singles: bool,
-):
-    artist: types.Artist = ytmusic.get_artist(channel_id)
+    album_only: Optional[bool] = None,
+) -> str:
+    """
+    Adds the albums of an artist to global_albums
+    :param album_only: only add unknown albums, defaults to Options.album_only
+    :return: the release fingerprint, to be stored once the albums have been processed
+    """
+    if album_only is None:
+        album_only = types.Options.album_only
+    with metrics.timer("ytmusic_get_artist"):
+        artist: types.Artist = get_ytmusic().get_artist(channel_id)
+    fingerprint: str = get_release_fingerprint(artist, no_singles)
+    if album_only and database.get_artist_fingerprint(channel_id) == fingerprint:
+        # nothing has been released since the last check
+        return fingerprint
     artist["topic_channel_id"] = get_topic_channel_id(artist) or channel_id
     artist["path"] = database.get_unique_artist_path(artist)
     database.insert_artist(artist, no_singles)
@@ -40,9 +63,10 @@ def process_artist(
     singles: list[types.SingleResult] = get_singles_for_artist(artist)
     if albums:
         for album in albums:
-            if not types.Options.album_only or not database.check_album_exists(album):
+            if not album_only or not database.check_album_exists(album):
                 global_albums.append((album, artist, artist_destination))
     if singles and not no_singles:
         for single in singles:
-            if not types.Options.album_only or not database.check_album_exists(single):
+            if not album_only or not database.check_album_exists(single):
                 global_albums.append((single, artist, artist_destination))
+    return fingerprint
@@ -1,3 +1,5 @@
+import sqlite3
+import time
 import traceback
 from pathlib import Path
 from typing import Optional
@@ -5,20 +7,59 @@ from typing import Optional
 from tqdm import tqdm
 from tqdm.contrib.concurrent import thread_map
 
-from process.album import process_album, TrackInput
+from process.album import process_album
 from process.artist import process_artist, AlbumInput
+from process.journal import finish_track, resume_tracks
 
 from process.track import process_album_track
-from util import types, database
+from process.util import album_flight
+from util import types, database, metrics, status
 from util.io import eprint, get_output_pipe, always_gen
 
 
-def process_track_interop(args: TrackInput, results: types.ResultTuple):
-    tracks, albums, errors = results
+# error class: (retry interval in seconds, whether it doubles with every failed attempt)
+RETRY_POLICIES: dict[str, tuple[int, bool]] = {
+    # permanent, but videos might be added or unrestricted eventually
+    "no video": (30 * 24 * 60 * 60, False),
+    "age restricted": (30 * 24 * 60 * 60, False),
+    "sabr": (60 * 60, True),
+    "assertion": (60 * 60, True),
+    "other": (60 * 60, True),
+}
+MAX_RETRY_INTERVAL: int = 30 * 24 * 60 * 60
+
+
+def classify_error(error_result: str) -> str:
+    if error_result == "Did not find any matching video at all":
+        return "no video"
+    if error_result == "Age restricted":
+        return "age restricted"
+    if error_result == "SABR Maximum reload attempts reached":
+        return "sabr"
+    if error_result.startswith("Failed assertion"):
+        return "assertion"
+    return "other"
+
+
+def record_failure(alid: int, track: types.Track, error_result: str):
+    video_id: str = database.get_video_id_for_track(track)
+    error_class: str = classify_error(error_result)
+    attempts: int = database.get_failed_track_attempts(alid, video_id) + 1
+    interval, exponential = RETRY_POLICIES[error_class]
+    if exponential:
+        interval = min(interval * 2 ** (attempts - 1), MAX_RETRY_INTERVAL)
+    database.insert_failed_track(
+        alid, video_id, error_class, error_result, attempts, int(time.time()) + interval
+    )
+
+
+def process_track_interop(job: types.TrackJob, results: types.ResultTuple):
     error_result: Optional[str] = None
+    status.set_stage(job, "starting")
     for i in range(2):
         try:
-            process_album_track(*args)
+            with metrics.timer("track"):
+                process_album_track(job)
             error_result = None
             break
         except RuntimeError as e:
@@ -30,57 +71,97 @@ def process_track_interop(args: TrackInput, results: types.ResultTuple):
                 error_result = 'SABR Maximum reload attempts reached'
             else:
                 error_result = traceback.format_exc()
-    album: types.Album = args[1]
-    track: types.Track = album["tracks"][args[0]]
-    artist: types.Artist = args[2]
+    try:
+        record_result(job, error_result, results)
+    except sqlite3.OperationalError:
+        # e.g. locked for longer than the timeout, the other tracks continue
+        eprint(
+            f'Warning: could not record the result of track {job.track["title"]}'
+            f" from album {job.album_title}\n" + traceback.format_exc()
+        )
+
+
+def record_result(job: types.TrackJob, error_result: Optional[str], results: types.ResultTuple):
+    tracks, albums, errors = results
+    status.finish(job)
+    # failures are tracked by the retry queue instead
+    finish_track(job)
+    track: types.Track = job.track
     if error_result:
+        metrics.count(f"tracks_failed_{classify_error(error_result).replace(' ', '_')}")
+        record_failure(job.alid, track, error_result)
         result_error: types.ResultError = {
             "title": track["title"],
-            "album": album["title"],
-            "artist": artist["name"],
+            "album": job.album_title,
+            "artist": job.artist_name,
             "traceback": error_result,
             "id": track["videoId"],
         }
         errors.append(result_error)
+        status.add_error(result_error)
         eprint(
-            f'Warning: could not process track {track["title"]} from album {album["title"]}'
+            f'Warning: could not process track {track["title"]} from album {job.album_title}'
         )
     else:
+        metrics.count("tracks_done")
+        database.delete_failed_track(job.alid, database.get_video_id_for_track(track))
         result_track: types.ResultTrack = {
             "id": track["videoId"],
             "title": track["title"],
-            "album": album["title"],
-            "artist": artist["name"],
+            "album": job.album_title,
+            "artist": job.artist_name,
         }
         tracks.append(result_track)
         result_album: types.ResultAlbum = {
-            "title": album["title"],
-            "artist": artist["name"],
+            "title": job.album_title,
+            "artist": job.artist_name,
         }
-        albums[album["audioPlaylistId"]] = result_album
+        albums[job.playlist_id] = result_album
+
+
+def process_tracks(tracks: list[types.TrackJob], results: types.ResultTuple, desc: str):
+    threads = types.Options.processing_threads
+    output_gen = always_gen(len(tracks), results)
+    thread_map(
+        process_track_interop,
+        tracks,
+        output_gen,
+        max_workers=threads,
+        desc=desc,
+        unit="track",
+        file=get_output_pipe(),
+    )
 
 
 def process_artists(
     channels: list[tuple[str, bool]], destination: Path, results: types.ResultTuple
 ):
     progress_output = get_output_pipe()
+    if not database.daemon_running() and (resumed := resume_tracks()):
+        # finish what has been interrupted, before discovering new tracks
+        process_tracks(resumed, results, "Resuming tracks")
     albums: list[AlbumInput] = []
+    fingerprints: dict[str, str] = {}
     for channel in tqdm(
         channels, desc="Processing artists", unit="artist", file=progress_output
     ):
         try:
-            process_artist(channel[0], destination, albums, channel[1])
+            fingerprints[channel[0]] = process_artist(
+                channel[0], destination, albums, channel[1]
+            )
         except:
             eprint(f'{channel[0]} had error\n' + traceback.format_exc())
-    if not albums or database.daemon_running():
+    if database.daemon_running():
         return
-    tracks: list[TrackInput] = []
+    tracks: list[types.TrackJob] = []
     for album in tqdm(
         albums, desc="Processing albums", unit="album", file=progress_output
     ):
         try:
             process_album(album[0], album[1], album[2], tracks)
         except:
+            # retry the albums of this artist next time, even without new releases
+            fingerprints.pop(album[1]["channelId"], None)
             error: types.ResultError = {
                 "title": None,
                 "album": album[0]["title"],
@@ -93,16 +174,11 @@ def process_artists(
                 f'{album[0]["title"]} from {album[1]["name"]} had error\n'
                 + traceback.format_exc()
             )
+    for channel_id, fingerprint in fingerprints.items():
+        database.update_artist_fingerprint(channel_id, fingerprint)
+    # the queued tracks only keep what they need, the complete albums can be freed
+    albums.clear()
+    album_flight.clear()
     if not tracks:
         return
-    threads = types.Options.processing_threads
-    output_gen = always_gen(len(tracks), results)
-    thread_map(
-        process_track_interop,
-        tracks,
-        output_gen,
-        max_workers=threads,
-        desc="Processing tracks",
-        unit="track",
-        file=progress_output,
-    )
+    process_tracks(tracks, results, "Processing tracks")
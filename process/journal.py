@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+from util import types, database
+
+# extensions of downloaded streams, before they are converted
+TEMPORARY_SUFFIXES: tuple[str, ...] = (".webm", ".mp4", ".m4a")
+
+
+def queue_tracks(tracks: list[types.TrackJob], jobs: list[types.TrackJob]):
+    """
+    Adds tracks to the list of tracks to process, and records them in the
+    journal, so they can be resumed if the process is killed
+    """
+    for job in jobs:
+        database.insert_job(
+            job.alid,
+            database.get_video_id_for_track(job.track),
+            json.dumps(job.to_dict()),
+        )
+    tracks.extend(jobs)
+
+
+def finish_track(job: types.TrackJob):
+    database.delete_job(job.alid, database.get_video_id_for_track(job.track))
+
+
+def get_download(alid: int, track: types.Track) -> Optional[str]:
+    """:return: the completely downloaded file of an interrupted job, if present"""
+    job = database.get_job(alid, database.get_video_id_for_track(track))
+    if job and job[0] == "encoding" and job[1] and Path(job[1]).is_file():
+        return job[1]
+    return None
+
+
+def get_download_prefix(track_id: int) -> str:
+    """
+    :return: the prefix of the file name, the stream of a track is downloaded to,
+        separated from the title, so it does not match other track numbers
+    """
+    return f"{track_id}_"
+
+
+def clean_temporary_files(album_destination: Path, prefixes: set[str], keep: set[str]):
+    """
+    Removes the downloads of the journaled tracks of an album, except for the
+    ones to keep. Other files are never touched, even with the same extensions.
+    """
+    if not album_destination.is_dir():
+        return
+    for file in album_destination.iterdir():
+        if (
+            file.suffix in TEMPORARY_SUFFIXES
+            and str(file) not in keep
+            and any(file.name.startswith(prefix) for prefix in prefixes)
+        ):
+            file.unlink()
+
+
+def resume_tracks() -> list[types.TrackJob]:
+    """
+    Restores the tracks that have not been finished by a previous run, and
+    removes the temporary files of downloads that were interrupted
+    """
+    tracks: list[types.TrackJob] = []
+    downloads: dict[Path, tuple[set[str], set[str]]] = {}
+    for job_data, state, tmp_path in database.get_jobs():
+        job: types.TrackJob = types.TrackJob.from_dict(json.loads(job_data))
+        prefixes, keep = downloads.setdefault(job.album_destination, (set(), set()))
+        prefixes.add(get_download_prefix(job.track_index + 1))
+        if state == "encoding" and tmp_path:
+            keep.add(tmp_path)
+        tracks.append(job)
+    for album_destination, (prefixes, keep) in downloads.items():
+        clean_temporary_files(album_destination, prefixes, keep)
+    return tracks
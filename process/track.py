@@ -1,13 +1,16 @@
+import os
 from pathlib import Path
+from shutil import copyfile
 from time import sleep
 from typing import Optional
 
-from pathvalidate import sanitize_filename
 from pytubefix import YouTube, Stream, exceptions
 
-from util import types, convert_audio, database
-from util.io import eprint
-from .util import video_search
+from util import types, convert_audio, database, metrics, status
+from util.io import eprint, get_track_filename
+from .album import get_cover
+from .journal import get_download, get_download_prefix
+from .util import similarity_matrix, video_search
 
 from fuzzywuzzy import fuzz
 
@@ -55,32 +58,103 @@ def score_result(
     return score, result["id"]
 
 
+class NormalizedResult:
+    """A search result with all strings prepared for scoring"""
+
+    __slots__ = ("id", "title", "lower_title", "duration", "description")
+
+    def __init__(self, result: types.YoutubeSearchVideoResult):
+        self.id: str = result["id"]
+        self.title: str = result["title"]
+        self.lower_title: str = result["title"].lower()
+        self.duration: Optional[str] = result["duration"]
+        self.description: str = merge_description(result["descriptionSnippet"]).lower()
+
+
+def pick_results(
+    searches: list[tuple[list[types.YoutubeSearchVideoResult], types.Track, types.Album]],
+) -> list[Optional[str]]:
+    """
+    Scores the results of many searches at once, with the same scoring as score_result
+    :param searches: the search results together with the track and album they are for
+    :return: the id of the best result per search, None if no result is good enough
+    """
+    picks: list[Optional[str]] = []
+    normalized_albums: dict[int, tuple[str, str]] = {}
+    for results, track, album in searches:
+        if not results:
+            picks.append(None)
+            continue
+        if id(album) not in normalized_albums:
+            normalized_albums[id(album)] = (album["title"].lower(), album.get("year", "\0"))
+        album_title, year = normalized_albums[id(album)]
+        track_title: str = track["title"].lower()
+        duration: Optional[str] = track.get("duration")
+        candidates: list[NormalizedResult] = [NormalizedResult(result) for result in results]
+        # rounded like fuzz.ratio, which also rates empty titles with 0
+        similarities: list[int] = [
+            round(similarity * 100) if candidate.lower_title and track_title else 0
+            for candidate, similarity in zip(
+                candidates,
+                similarity_matrix([track_title], [candidate.lower_title for candidate in candidates])[0],
+            )
+        ]
+        best_score: float = 0.0
+        best_id: Optional[str] = None
+        for candidate, similarity in zip(candidates, similarities):
+            if candidate.title == track["title"]:
+                score = 5.0
+            else:
+                score = similarity / 100 * 4
+            if candidate.duration == duration:
+                score += 3
+            if track_title == album_title:
+                if candidate.description.count(track_title) == 2:
+                    score += 2
+            elif album_title in candidate.description:
+                score += 2
+            if year in candidate.description:
+                score += 1
+            if best_id is None or score > best_score:
+                best_score, best_id = score, candidate.id
+        picks.append(best_id if best_score > 1 else None)
+    return picks
+
+
 def search_and_pick(
     search_query: str, track: types.Track, album: types.Album
 ) -> Optional[str]:
-    search = video_search(search_query)
-    # score all results
-    scored = [score_result(result, track, album) for result in search]
-    # sort by score in reverse order (biggest score first)
-    scored.sort(key=lambda x: -x[0])
-    if scored and scored[0][0] > 1:
-        return scored[0][1]
+    return pick_results([(video_search(search_query), track, album)])[0]
+
+
+def get_search_query(track: types.Track, album: types.Album, artist: types.Artist) -> str:
+    short_title: str = track["title"].split("(")[0].split('"')[0]
+    short_album: str = album["title"].split("(")[0].split('"')[0]
+    return f'{artist["name"]} - topic "provided to youtube by" {album["title"]} {track["title"]} "{short_album}" "{short_title}"'
 
 
 def get_alternative_track_id(
     track: types.Track, album: types.Album, artist: types.Artist
 ) -> Optional[str]:
-    short_title: str = track["title"].split("(")[0].split('"')[0]
-    short_album: str = album["title"].split("(")[0].split('"')[0]
-    result = search_and_pick(
-        f'{artist["name"]} - topic "provided to youtube by" {album["title"]} {track["title"]} "{short_album}" "{short_title}"',
-        track,
-        album,
-    )
+    result = search_and_pick(get_search_query(track, album, artist), track, album)
     return result
 
 
-def get_stream(video_url: str) -> Stream:
+def get_alternative_track_ids(
+    tracks: list[types.Track], album: types.Album, artist: types.Artist
+) -> list[Optional[str]]:
+    """
+    Searches videos for many tracks of an album, and scores all of their results in one pass
+    :return: the picked video id per track, if any
+    """
+    searches = [
+        (video_search(get_search_query(track, album, artist)), track, album)
+        for track in tracks
+    ]
+    return pick_results(searches)
+
+
+def get_stream(video_url: str) -> tuple[YouTube, Stream]:
     video: Optional[YouTube] = YouTube(video_url)
     video.visitor_data
     stream: Optional[Stream]
@@ -92,62 +166,173 @@ def get_stream(video_url: str) -> Stream:
         stream = video.streams.get_audio_only()
     if not stream:
         stream = video.streams.get_highest_resolution()
-    return stream
+    return video, stream
+
+
+def get_stream_metadata(video: YouTube, stream: Stream) -> convert_audio.StreamMetadata:
+    """
+    Reads sample rate and bit rate from the stream manifest, so the downloaded
+    file does not need to be probed
+    """
+    stream_format: dict = {}
+    streaming_data: dict = video.streaming_data or {}
+    for candidate in (
+        *streaming_data.get("adaptiveFormats", []),
+        *streaming_data.get("formats", []),
+    ):
+        if int(candidate.get("itag", -1)) == stream.itag:
+            stream_format = candidate
+            break
+    sample_rate: Optional[str] = stream_format.get("audioSampleRate")
+    # the average bitrate is what ffprobe reports as well, bitrate is the peak
+    bit_rate: Optional[int] = stream_format.get("averageBitrate") or stream.bitrate
+    return convert_audio.StreamMetadata(
+        str(sample_rate) if sample_rate else None,
+        str(bit_rate) if bit_rate else None,
+    )
+
+
+def download_and_analyze(
+    video: YouTube, stream: Stream, track_path: Path, track_id: int
+) -> tuple[str, Optional[dict[str, str]]]:
+    """
+    Downloads the stream, while feeding the downloaded bytes into the loudness
+    analysis if enabled
+    :return: the path of the downloaded file and the loudness measurement, if available
+    """
+    analysis: Optional[convert_audio.StreamingLoudnessAnalysis] = None
+    if types.Options.stream_analysis:
+        analysis = convert_audio.StreamingLoudnessAnalysis()
+        video.register_on_progress_callback(
+            lambda _, chunk, __: analysis.feed(chunk)
+        )
+    try:
+        with metrics.timer("download"):
+            track_tmp_path = stream.download(
+                output_path=str(track_path.parent),
+                filename_prefix=get_download_prefix(track_id),
+            )
+    except:
+        if analysis:
+            analysis.abort()
+        raise
+    metrics.count("download_bytes", Path(track_tmp_path).stat().st_size)
+    if not analysis:
+        return track_tmp_path, None
+    with metrics.timer("loudness_analysis_stream"):
+        return track_tmp_path, analysis.finish()
+
+
+def reuse_encoded_track(
+    video_id: str, alid: int, track_path: Path, metadata: convert_audio.Metadata
+) -> bool:
+    """
+    Creates the track from the same video encoded for another album. The tags
+    differ at least in album and track number, so the file is copied and only
+    its tags are rewritten, without encoding it again.
+    :return: whether the track has been created
+    """
+    for source in database.get_track_paths(video_id, alid):
+        if source.suffix != track_path.suffix or not source.is_file():
+            continue
+        if source.resolve() == track_path.resolve():
+            return True
+        # an existing track is only replaced, once the copy is complete
+        tmp_path: Path = track_path.with_name(f".{track_path.name}.tmp")
+        try:
+            with metrics.timer("copy"):
+                copyfile(source, tmp_path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            continue
+        if convert_audio.write_tags(tmp_path, metadata):
+            os.replace(tmp_path, track_path)
+            metrics.count("tracks_copied")
+            return True
+        tmp_path.unlink(missing_ok=True)
+    return False
 
 
 def process_track(
     track: types.Track,
-    artist: types.Artist,
     track_path: Path,
     track_id: int,
-    album: types.Album,
+    metadata: convert_audio.Metadata,
     video_url: Optional[str],
+    alid: Optional[int] = None,
+    job: Optional[types.TrackJob] = None,
 ) -> bool:
-    if not video_url:
-        raise RuntimeError("Did not find any matching video at all")
+    """
+    :param alid: the album of the track, if the progress should be recorded in the journal
+    :param job: the job of the track, if the progress should be reported in the status
+    """
+    video_id: str = database.get_video_id_for_track(track)
+    stream_metadata: Optional[convert_audio.StreamMetadata] = None
+    loudness: Optional[dict[str, str]] = None
+    track_tmp_path: Optional[str] = get_download(alid, track) if alid else None
+    if not track_tmp_path and alid and reuse_encoded_track(video_id, alid, track_path, metadata):
+        return True
+    if not track_tmp_path:
+        if not video_url:
+            raise RuntimeError("Did not find any matching video at all")
+        try:
+            with metrics.timer("stream_info"):
+                video, stream = get_stream(video_url)
+        except exceptions.AgeRestrictedError:
+            raise RuntimeError("Age restricted")
+        except exceptions.BotDetection:
+            eprint("Waiting 30min due to bot detection")
+            status.back_off(30*60)
+            sleep(30*60) # 30min sleep
+            video, stream = get_stream(video_url)
+
+        stream_metadata = get_stream_metadata(video, stream)
+        if alid:
+            database.update_job(alid, video_id, "downloading")
+        if job:
+            status.set_stage(job, "downloading")
+        track_tmp_path, loudness = download_and_analyze(
+            video, stream, track_path, track_id
+        )
+        if alid:
+            database.update_job(alid, video_id, "encoding", track_tmp_path)
+    if job:
+        status.set_stage(job, "encoding")
     try:
-        stream = get_stream(video_url)
-    except exceptions.AgeRestrictedError:
-        raise RuntimeError("Age restricted")
-    except exceptions.BotDetection:
-        print("Waiting 30min due to bot detection")
-        sleep(30*60) # 30min sleep
-        stream = get_stream(video_url)
-
-    track_tmp_path = stream.download(
-        output_path=str(track_path.parent), filename_prefix=str(track_id)
-    )
-    metadata: convert_audio.Metadata = convert_audio.Metadata.from_ytmusic(
-        track, track_id, album, artist
-    )
-    convert_success: bool = convert_audio.level_and_combine_audio(
-        track_tmp_path, track_path, metadata
-    )
-    if convert_success:
-        Path(track_tmp_path).unlink()
-    return convert_success
+        return convert_audio.level_and_combine_audio(
+            track_tmp_path,
+            track_path,
+            metadata,
+            loudness=loudness,
+            stream_metadata=stream_metadata,
+        )
+    finally:
+        # the job is finished either way, a failed track is downloaded again on retry
+        Path(track_tmp_path).unlink(missing_ok=True)
 
 
-def process_album_track(
-    track_id: int,
-    album: types.Album,
-    artist: types.Artist,
-    album_destination: Path,
-    alid: int,
-    video_url: Optional[str],
-):
-    track: types.Track = album["tracks"][track_id]
-    track_id += 1
+def process_album_track(job: types.TrackJob):
+    track: types.Track = job.track
+    track_id: int = job.track_index + 1
     extension = "mp3" if types.Options.mp3 else "opus"
-    track_path: Path = album_destination.joinpath(
-        f'{track_id:02} - {sanitize_filename(track["title"])}.{extension}'
+    track_path: Path = job.album_destination.joinpath(
+        get_track_filename(track_id, track["title"], extension)
     )
+    metadata: convert_audio.Metadata = convert_audio.Metadata.from_job(job)
     convert_success: bool = process_track(
-        track, artist, track_path, track_id, album, video_url
+        track,
+        track_path,
+        track_id,
+        metadata,
+        job.video_url,
+        job.alid,
+        job,
     )
     if convert_success:
-        database.insert_track(alid, track, track_id)
+        if cover := get_cover(job.album_destination):
+            convert_audio.embed_cover(track_path, cover)
+        database.insert_track(job.alid, track, track_id, track_path, metadata.tags())
     else:
         eprint(
-            f'Warning: could not process track {track["title"]} from album {album["title"]}'
+            f'Warning: could not process track {track["title"]} from album {job.album_title}'
         )
@@ -1,29 +1,230 @@
 from __future__ import annotations
-from typing import List, Optional, Tuple, Dict
+import re
+import threading
+from copy import deepcopy
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Dict
 
-from youtubesearchpython import VideosSearch
-from ytmusicapi import YTMusic
-from pytubefix import Playlist
-from fuzzywuzzy import fuzz, process
-from util.types import YoutubeSearchVideoResult, Album, Track
+from youtubesearchpython import VideosSearch, ChannelsSearch, CustomSearch
+from pytubefix import Playlist, YouTube
+from Levenshtein import ratio
+from util import metrics
+from util.cache import cached_search, SingleFlight
+from util.types import YoutubeSearchVideoResult, Album, Track, PlaylistEntry
 
-# Some releases are at "midnight local time". To ensure, that this happens
-# as early as possible, the location is set to New Zeeland (UTC +12)
-ytmusic: YTMusic = YTMusic(location='NZ')
+if TYPE_CHECKING:
+    from ytmusicapi import YTMusic
+
+# created on first use by get_ytmusic, as many runs never need it
+ytmusic: Optional[YTMusic] = None
+ytmusic_lock = threading.Lock()
+
+
+def create_ytmusic() -> YTMusic:
+    from ytmusicapi import YTMusic
+
+    # Some releases are at "midnight local time". To ensure, that this happens
+    # as early as possible, the location is set to New Zeeland (UTC +12)
+    return YTMusic(location='NZ')
+
+
+def get_ytmusic() -> YTMusic:
+    global ytmusic
+    with ytmusic_lock:
+        if ytmusic is None:
+            ytmusic = create_ytmusic()
+        return ytmusic
+
+# albums fetched within this run, set max_age for long-running processes
+album_flight: SingleFlight = SingleFlight(memoize=True)
+
+
+def get_album(browse_id: str) -> Album:
+    """
+    Fetches an album, concurrent and repeated requests of the same album are
+    only sent once
+    :return: a copy of the album, that can be modified by the caller
+    """
+
+    def fetch() -> Album:
+        with metrics.timer("ytmusic_get_album"):
+            return get_ytmusic().get_album(browse_id)
+
+    return deepcopy(album_flight.do(browse_id, fetch))
+
+
+DURATION_REGEX: re.Pattern = re.compile(r"^(?:(\d+):)?(\d?\d):(\d\d)$")
+
+
+def parse_duration(duration: Optional[str]) -> Optional[int]:
+    if duration and (match := DURATION_REGEX.match(duration.strip())):
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+    return None
+
+
+def get_text(text: Any) -> Optional[str]:
+    if isinstance(text, dict):
+        if "simpleText" in text:
+            return text["simpleText"]
+        if "runs" in text:
+            return "".join(run["text"] for run in text["runs"])
+        return text.get("content")
+    return text
+
+
+class AlbumPlaylist(Playlist):
+    """
+    A playlist, that keeps the titles and durations of the playlist pages,
+    instead of requiring a watch page request per video to get them
+    """
+
+    def __init__(self, url: str):
+        super().__init__(url)
+        self.entries: Dict[str, PlaylistEntry] = {}
+
+    def _extract_ids(self, items: list) -> list:
+        for item in items:
+            try:
+                self._extract_entry(item)
+            except (KeyError, IndexError, TypeError):
+                ...
+        return super()._extract_ids(items)
+
+    def _extract_entry(self, item: dict):
+        if "playlistVideoRenderer" in item:
+            renderer = item["playlistVideoRenderer"]
+            self.entries[renderer["videoId"]] = {
+                "title": get_text(renderer.get("title")),
+                "duration_seconds": int(renderer["lengthSeconds"])
+                if renderer.get("lengthSeconds")
+                else None,
+            }
+        elif "lockupViewModel" in item:
+            lockup = item["lockupViewModel"]
+            metadata = lockup["metadata"]["lockupMetadataViewModel"]
+            duration: Optional[int] = None
+            for badge in self._find_dict_values(
+                lockup.get("contentImage", {}), "thumbnailBadgeViewModel"
+            ):
+                duration = duration or parse_duration(badge.get("text"))
+            self.entries[lockup["contentId"]] = {
+                "title": get_text(metadata.get("title")),
+                "duration_seconds": duration,
+            }
+
+    def get_entry(self, video_url: str) -> PlaylistEntry:
+        video_id: str = video_url.split("v=")[-1]
+        return self.entries.get(video_id, {"title": None, "duration_seconds": None})
 
 
 def video_search(query: str) -> List[YoutubeSearchVideoResult]:
-    search = VideosSearch(query)
-    return search.result()["result"]
+    def search() -> List[YoutubeSearchVideoResult]:
+        with metrics.timer("video_search"):
+            return VideosSearch(query).result()["result"]
+
+    return cached_search("video", query, search)
+
+
+def channel_search(query: str) -> Tuple[List[dict], Optional[str]]:
+    """
+    :return: the found channels, and the search params of the original query,
+        if YouTube searched for a corrected query instead
+    """
+
+    def search() -> Tuple[List[dict], Optional[str]]:
+        with metrics.timer("channel_search"):
+            channels = ChannelsSearch(query)
+        params: Optional[str] = None
+        if channels.responseSource and (
+            alt := channels.responseSource[0].get("showingResultsForRenderer")
+        ):
+            params = alt["originalQueryEndpoint"]["searchEndpoint"]["params"]
+        return channels.result()["result"], params
+
+    return tuple(cached_search("channel", query, search))
+
+
+def custom_search(query: str, params: str) -> List[dict]:
+    def search() -> List[dict]:
+        with metrics.timer("custom_search"):
+            return CustomSearch(query, params).result()["result"]
 
+    return cached_search(f"custom {params}", query, search)
 
-def get_best_match(present_titles: List[str], current_track: Track) -> int:
-    result: Optional[Tuple[str, int]] = process.extractOne(
-        current_track["title"], present_titles, scorer=fuzz.ratio
+
+# weights of the title similarity and duration agreement when aligning tracks
+TITLE_WEIGHT: float = 1.0
+DURATION_WEIGHT: float = 0.5
+# durations differing by this many seconds or more don't add to the score
+DURATION_TOLERANCE: float = 10.0
+
+
+def similarity_matrix(
+    track_titles: List[str], video_titles: List[str]
+) -> List[List[float]]:
+    """
+    Computes the title similarity of every track with every video
+    :return: a matrix with one row per track, each containing a similarity from 0 to 1 per video
+    """
+    track_titles = [title.lower() for title in track_titles]
+    video_titles = [title.lower() for title in video_titles]
+    return [[ratio(track, video) for video in video_titles] for track in track_titles]
+
+
+def score_matrix(
+    tracks: List[Track], videos: List[PlaylistEntry]
+) -> List[List[float]]:
+    similarities = similarity_matrix(
+        [track["title"] for track in tracks],
+        [video["title"] or "" for video in videos],
     )
-    if result:
-        return result[1]
-    return 0
+    for track, row in zip(tracks, similarities):
+        track_duration: Optional[int] = track.get("duration_seconds")
+        for j, video in enumerate(videos):
+            row[j] *= TITLE_WEIGHT
+            video_duration: Optional[int] = video["duration_seconds"]
+            # a duration of 0 means, that the duration is unknown
+            if track_duration and video_duration:
+                difference: float = abs(track_duration - video_duration)
+                row[j] += DURATION_WEIGHT * max(0.0, 1 - difference / DURATION_TOLERANCE)
+    return similarities
+
+
+def align_tracks(scores: List[List[float]]) -> List[Optional[int]]:
+    """
+    Assigns every video to exactly one track, keeping the order of both and
+    maximizing the total score
+    :param scores: a matrix with one row per track and one column per video
+    :return: the index of the assigned video per track, None if the track has no video
+    """
+    track_count: int = len(scores)
+    video_count: int = len(scores[0]) if scores else 0
+    # best[i][j]: best total score of matching the first j videos to the first i tracks
+    best: List[List[float]] = [
+        [float("-inf")] * (video_count + 1) for _ in range(track_count + 1)
+    ]
+    taken: List[bytearray] = [bytearray(video_count + 1) for _ in range(track_count + 1)]
+    best[0][0] = 0.0
+    for i in range(1, track_count + 1):
+        row: List[float] = scores[i - 1]
+        previous: List[float] = best[i - 1]
+        current: List[float] = best[i]
+        current[0] = 0.0
+        # enough tracks need to be left over for the remaining videos
+        for j in range(max(1, video_count - track_count + i), min(i, video_count) + 1):
+            take: float = previous[j - 1] + row[j - 1]
+            if take >= previous[j]:
+                current[j] = take
+                taken[i][j] = 1
+            else:
+                current[j] = previous[j]
+    result: List[Optional[int]] = [None] * track_count
+    j: int = video_count
+    for i in range(track_count, 0, -1):
+        if j and taken[i][j]:
+            j -= 1
+            result[i - 1] = j
+    return result
 
 
 def match_playlist_and_album(album: Album) -> List[Optional[str]]:
@@ -32,34 +233,27 @@ def match_playlist_and_album(album: Album) -> List[Optional[str]]:
     :param album: the album containing the titles
     :return: a list containing an optional video url per track
     """
-    playlist: Playlist = Playlist(
+    playlist: AlbumPlaylist = AlbumPlaylist(
         f'https://www.youtube.com/playlist?list={album["audioPlaylistId"]}'
     )
-    # album_len will be decreased by one per removed track
     album_len: int = len(album["tracks"])
-    playlist_len: int = len(playlist.video_urls)
+    with metrics.timer("playlist_fetch"):
+        playlist_len: int = len(playlist.video_urls)
     if playlist_len == album_len:
         return list(playlist.video_urls)
-    if len(playlist.video_urls) > len(album["tracks"]):
+    if playlist_len > album_len:
         raise RuntimeError("More videos present in playlist than in album")
     if playlist_len == 0:
         raise RuntimeError("Empty playlist")
-    videos: List[str] = [video.title for video in playlist.videos]
-    rating: Dict[int, int] = {
-        i: get_best_match(videos, track) for i, track in enumerate(album["tracks"])
-    }
-    while album_len > playlist_len:
-        worst_score: int = min(rating.values())
-        worst_idx: Optional[int] = None
-        for i, v in rating.items():
-            if v == worst_score:
-                worst_idx = i
-                break
-        assert worst_idx is not None
-        del rating[worst_idx]
-        album_len -= 1
-    playlist_urls = (url for url in playlist.video_urls)
+    videos: List[PlaylistEntry] = []
+    for url in playlist.video_urls:
+        entry: PlaylistEntry = playlist.get_entry(url)
+        if entry["title"] is None:
+            # not part of the playlist pages (e.g. watch panel continuation)
+            video: YouTube = YouTube(url)
+            entry = {"title": video.title, "duration_seconds": video.length}
+        videos.append(entry)
+    alignment = align_tracks(score_matrix(album["tracks"], videos))
     return [
-        next(playlist_urls) if idx in rating else None
-        for idx in range(len(album["tracks"]))
+        playlist.video_urls[idx] if idx is not None else None for idx in alignment
     ]
@@ -6,12 +6,11 @@ from pathlib import Path
 from typing import Optional
 from json import loads
 
-from pathvalidate import sanitize_filename
 from pytubefix import YouTube, Stream
 from tqdm import tqdm
 
 from util import types, convert_audio, database
-from util.io import eprint, join_and_create
+from util.io import eprint, join_and_create, get_track_filename
 
 TIME_GROUP: str = r"((?:\d?\d:)?\d?\d:\d\d)"
 NAME_GROUP: str = r"(.*)"
@@ -24,6 +23,7 @@ class Arguments:
     album: Optional[str]
     year: Optional[str]
     mp3: bool
+    encoder_profile: str
     destination: Path
     video_id: str
 
@@ -45,6 +45,14 @@ def parse_args() -> Arguments:
     parser.add_argument(
         "--mp3", action="store_true", help="produce mp3 files instead of ogg files"
     )
+    parser.add_argument(
+        "--encoder-profile",
+        default=types.Options.encoder_profile,
+        choices=list(types.ENCODER_PROFILES),
+        help="Trade encoding speed for resampling and encoder quality,"
+        " see benchmark/encoder_profiles.py, default: "
+        f"{types.Options.encoder_profile}",
+    )
     parser.add_argument(
         "destination",
         metavar="D",
@@ -56,6 +64,7 @@ def parse_args() -> Arguments:
     )
     args: Arguments = parser.parse_args(namespace=Arguments())
     types.Options.mp3 = args.mp3
+    types.Options.encoder_profile = args.encoder_profile
     return args
 
 
@@ -141,7 +150,7 @@ def process_args(args: Arguments):
         )
         extension = "mp3" if types.Options.mp3 else "opus"
         track_path: Path = (
-            album_path / f"{track_id:02} - {sanitize_filename(name)}.{extension}"
+            album_path / get_track_filename(track_id, name, extension)
         )
         convert_audio.level_and_combine_audio(
             tmp_path, track_path, metadata, timestamp, next_timestamp
@@ -0,0 +1,19 @@
+import os
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+
+from util.replay import MODE_VARIABLE, Cassette
+
+# recorded responses, see util/replay.py
+CASSETTES: Path = Path(__file__).parent.joinpath("cassettes")
+
+
+def use_cassette(name: str) -> AbstractContextManager:
+    """
+    :return: the cassette of a test. Until it has been recorded, the test sends
+        live requests, unless MCD_REPLAY is set, e.g. to record it.
+    """
+    path: Path = CASSETTES.joinpath(name)
+    if path.exists() or os.environ.get(MODE_VARIABLE):
+        return Cassette(path)
+    return nullcontext()
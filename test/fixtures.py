@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Any
+
+from util import database, types
+
+# silent mpeg frames, enough for mutagen to read the file
+MP3: bytes = (b"\xff\xfb\x90\x64" + b"\x00" * 413) * 20
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Runs each test with a new library in a temporary directory, and restores
+    the global options afterward, so tests do not depend on their order
+    """
+
+    def setUp(self) -> None:
+        self.options: dict[str, Any] = {
+            name: value for name, value in vars(types.Options).items() if not name.startswith("_")
+        }
+        self.directory = tempfile.TemporaryDirectory()
+        self.destination = Path(self.directory.name)
+        database.init(self.destination.joinpath("test.db"))
+        self.patched: list[tuple[Any, str, Any]] = []
+
+    def patch(self, module: Any, name: str, value: Any) -> None:
+        """replaces an attribute of a module until the end of the test"""
+        self.patched.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def tearDown(self) -> None:
+        while self.patched:
+            module, name, value = self.patched.pop()
+            setattr(module, name, value)
+        database.get_connection().close()
+        database.thread_local.connection = None
+        database.db_path = None
+        self.directory.cleanup()
+        for name in [name for name in vars(types.Options) if not name.startswith("_")]:
+            if name not in self.options:
+                delattr(types.Options, name)
+        for name, value in self.options.items():
+            setattr(types.Options, name, value)
+
+    def insert_album(
+        self,
+        alid: int,
+        path: str,
+        title: str = "Album",
+        year: int = 2020,
+        track_count: int = 1,
+        last_update: int = 0,
+    ) -> None:
+        """inserts an album of the artist "Artist" (aid 1), inserting the artist if needed"""
+        conn = database.get_connection()
+        with conn:
+            conn.execute(
+                "insert or ignore into artist"
+                " (aid, name, channel_id, topic_channel_id, singles, path)"
+                " values (1, 'Artist', 'UC1', 'UC1', 1, 'Artist')"
+            )
+            conn.execute(
+                "insert into album (alid, browse_id, title, aid, year, track_count, duration, path,"
+                " last_update) values (?, ?, ?, 1, ?, ?, ?, ?, ?)",
+                (
+                    alid, f"MPREb_{alid}", title, year, track_count, 200 * track_count, path,
+                    last_update,
+                ),
+            )
@@ -0,0 +1,63 @@
+import process.album
+import process.util
+from process.album import process_album
+from test.fixtures import DatabaseTestCase
+from util import database, types
+
+
+class FakeYTMusic:
+    def get_album(self, browse_id: str) -> types.Album:
+        return {
+            "title": "Album",
+            "year": "2020",
+            "trackCount": 2,
+            "duration_seconds": 400,
+            "audioPlaylistId": "OLAK1",
+            "thumbnails": [],
+            # the video of the second track was replaced upstream
+            "tracks": [
+                {"videoId": "v1", "title": "Song", "duration_seconds": 200},
+                {"videoId": "v2", "title": "Other", "duration_seconds": 200},
+            ],
+        }
+
+
+class TestCompleteAlbum(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.insert_album(1, "Album", track_count=2)
+        conn = database.get_connection()
+        with conn:
+            conn.execute(
+                "insert into track (title, alid, video_id, duration, track_id)"
+                " values ('Song', 1, 'v1', 200, 1), ('Other', 1, 'v2old', 200, 2)"
+            )
+        self.playlist_requests: int = 0
+        self.patch(process.util, "ytmusic", FakeYTMusic())
+        self.patch(process.album, "retag_tracks", lambda album, artist, alid, destination: None)
+        self.patch(process.album, "match_playlist_and_album", self.match_playlist_and_album)
+        self.patch(process.album, "process_thumbnail", lambda album, destination: None)
+
+    def tearDown(self) -> None:
+        process.util.album_flight.results.clear()
+        super().tearDown()
+
+    def match_playlist_and_album(self, album: types.Album) -> list[str]:
+        self.playlist_requests += 1
+        return [f"https://youtube.com/watch?v={track['videoId']}" for track in album["tracks"]]
+
+    def process(self) -> list[types.TrackJob]:
+        artist: types.Artist = {"name": "Artist", "channelId": "UC1"}
+        tracks: list[types.TrackJob] = []
+        process_album({"browseId": "MPREb_1"}, artist, self.destination, tracks)
+        return tracks
+
+    def test_skipped(self) -> None:
+        self.assertEqual(self.process(), [])
+        self.assertEqual(self.playlist_requests, 0, "The playlist of a complete album was fetched")
+
+    def test_deep(self) -> None:
+        types.Options.deep = True
+        tracks = self.process()
+        self.assertEqual(self.playlist_requests, 1)
+        self.assertEqual([job.track["videoId"] for job in tracks], ["v2"])
@@ -1,5 +1,7 @@
 import unittest
-from process.util import match_playlist_and_album
+from typing import Optional
+from process.util import match_playlist_and_album, align_tracks, score_matrix
+from test import use_cassette
 from util.types import Track, Album, Artist, AlbumResults, SingleResults
 
 
@@ -120,8 +122,40 @@ VIDEOS: list[tuple[tuple[str, ...], str, str, tuple[str, ...]]] = [
 
 class TestVideoSearch(unittest.TestCase):
     def test(self) -> None:
-        for video_data in VIDEOS:
-            print(f"Testing {video_data}")
-            album = get_album(*video_data)
-            video_ids = match_playlist_and_album(album)
-            self.assertEqual(video_ids, list(video_data[3]), "Invalid video found")
+        with use_cassette("album_matching.json"):
+            for video_data in VIDEOS:
+                print(f"Testing {video_data}")
+                album = get_album(*video_data)
+                video_ids = match_playlist_and_album(album)
+                self.assertEqual(video_ids, list(video_data[3]), "Invalid video found")
+
+
+# track titles and durations, video titles and durations, expected video index per track
+ALIGNMENTS: list[
+    tuple[tuple[tuple[str, int], ...], tuple[tuple[str, int], ...], tuple[Optional[int], ...]]
+] = [
+    (
+        (("Intro", 60), ("Song", 200), ("Song", 320), ("Outro", 90)),
+        (("Song", 321), ("Outro", 90)),
+        (None, None, 0, 1),
+    ),
+    (
+        (("Song", 200), ("Song (Live)", 320), ("Song (Remix)", 250)),
+        (("Song", 200), ("Song (Remix)", 250)),
+        (0, None, 1),
+    ),
+]
+
+
+class TestTrackAlignment(unittest.TestCase):
+    def test(self) -> None:
+        for tracks, videos, expected in ALIGNMENTS:
+            album = get_album(tuple(title for title, _ in tracks), "...", "...")
+            for track, (_, duration) in zip(album["tracks"], tracks):
+                track["duration_seconds"] = duration
+            entries = [
+                {"title": title, "duration_seconds": duration}
+                for title, duration in videos
+            ]
+            alignment = align_tracks(score_matrix(album["tracks"], entries))
+            self.assertEqual(alignment, list(expected), "Invalid alignment found")
@@ -0,0 +1,56 @@
+import process.artist
+import process.util
+from process.artist import AlbumInput, process_artist
+from test.fixtures import DatabaseTestCase
+from util import database, types
+
+
+class FakeYTMusic:
+    def __init__(self, browse_ids: list[str]):
+        self.browse_ids: list[str] = browse_ids
+        self.album_requests: int = 0
+
+    def get_artist(self, channel_id: str) -> types.Artist:
+        # the artist page only shows the latest releases
+        return {
+            "name": "Artist",
+            "channelId": channel_id,
+            "description": None,
+            "albums": {
+                "browseId": "MPLA1",
+                "params": "all albums",
+                "results": [{"browseId": browse_id} for browse_id in self.browse_ids[:1]],
+            },
+        }
+
+    def get_artist_albums(self, browse_id: str, params: str) -> list[types.AlbumResult]:
+        self.album_requests += 1
+        return [{"browseId": browse_id, "title": browse_id} for browse_id in self.browse_ids]
+
+
+class TestReleaseFingerprint(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.patch(process.artist, "get_topic_channel_id", lambda artist: "UCtopic")
+
+    def process(self, ytmusic: FakeYTMusic) -> list[AlbumInput]:
+        self.patch(process.util, "ytmusic", ytmusic)
+        albums: list[AlbumInput] = []
+        fingerprint = process_artist("UC1", self.destination, albums, True, album_only=True)
+        database.update_artist_fingerprint("UC1", fingerprint)
+        return albums
+
+    def test_unchanged(self) -> None:
+        ytmusic = FakeYTMusic(["MPREb_1", "MPREb_0"])
+        self.assertEqual(len(self.process(ytmusic)), 2)
+        self.assertEqual(self.process(ytmusic), [])
+        self.assertEqual(ytmusic.album_requests, 1, "Albums of an unchanged artist were fetched")
+
+    def test_changed(self) -> None:
+        self.process(FakeYTMusic(["MPREb_1", "MPREb_0"]))
+        ytmusic = FakeYTMusic(["MPREb_2", "MPREb_1", "MPREb_0"])
+        albums = self.process(ytmusic)
+        self.assertEqual(ytmusic.album_requests, 1)
+        self.assertEqual(
+            [album["browseId"] for album, _, _ in albums], ["MPREb_2", "MPREb_1", "MPREb_0"]
+        )
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from audit import audit
+from test.fixtures import DatabaseTestCase
+from util import database, types
+
+
+class TestAudit(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        types.Options.background = True
+
+    def test(self) -> None:
+        self.insert_album(1, "Album: Live", track_count=2, last_update=100)
+        conn = database.get_connection()
+        with conn:
+            conn.execute(
+                "insert into track (tid, title, alid, video_id, duration, track_id)"
+                " values (1, 'Corrupt', 1, 'v1', 200, 1), (2, 'Missing', 1, 'v2', 200, 2)"
+            )
+        # album directories are sanitized and matched case-insensitive
+        album_path = self.destination.joinpath("artist", "album live")
+        album_path.mkdir(parents=True)
+        album_path.joinpath("01 - Corrupt.opus").write_bytes(b"\0" * 1024)
+        album_path.joinpath("03 - Orphan.mp3").write_bytes(b"\0" * 1024)
+        album_path.joinpath("cover.jpg").write_bytes(b"\0")
+        issues = {
+            (issue["issue"], Path(issue["path"]).name, issue["tid"])
+            for issue in audit(self.destination, 2, 5)
+        }
+        self.assertEqual(
+            issues,
+            {
+                ("corrupt", "01 - Corrupt.opus", 1),
+                ("missing", "02 - Missing.*", 2),
+                ("orphan", "03 - Orphan.mp3", None),
+            },
+        )
+        database.requeue_tracks([1, 2])
+        self.assertEqual(database.get_tracks_for_album(1), [])
+        self.assertEqual(database.get_least_recently_updated_album(), (1, 0))
@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from mutagen.id3 import ID3
+
+from process.album import cover_flight, embed_album_cover, get_cover_version
+from test.fixtures import MP3, DatabaseTestCase
+from util import database, types
+from util.convert_audio import Cover, embed_cover
+
+
+class TestCover(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.track_path = Path(self.directory.name).joinpath("01 - Song.mp3")
+        self.track_path.write_bytes(MP3)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test(self) -> None:
+        cover = Cover(b"\xff\xd8cover\xff\xd9")
+        self.assertTrue(embed_cover(self.track_path, cover))
+        self.assertTrue(embed_cover(self.track_path, cover))
+        self.assertEqual([frame.data for frame in ID3(self.track_path).getall("APIC")], [cover.data])
+        other = Cover(b"\xff\xd8other\xff\xd9")
+        self.assertTrue(embed_cover(self.track_path, other))
+        self.assertEqual([frame.data for frame in ID3(self.track_path).getall("APIC")], [other.data])
+
+
+class TestAlbumCover(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        types.Options.mp3 = True
+
+    def tearDown(self) -> None:
+        cover_flight.clear()
+        super().tearDown()
+
+    def test(self) -> None:
+        album_path = self.destination.joinpath("Artist", "Album")
+        album_path.mkdir(parents=True)
+        album_path.joinpath("cover.jpg").write_bytes(b"\xff\xd8cover\xff\xd9")
+        stored_path = album_path.joinpath("01 - Song.mp3")
+        legacy_path = album_path.joinpath("02 - Other.mp3")
+        for track_path in (stored_path, legacy_path):
+            track_path.write_bytes(MP3)
+        self.insert_album(1, "Album", track_count=3)
+        conn = database.get_connection()
+        with conn:
+            # the second track was inserted before the path was stored, the third is missing
+            conn.execute(
+                "insert into track (title, alid, video_id, duration, track_id, path)"
+                " values ('Song', 1, 'v1', 200, 1, 'Artist/Album/01 - Song.mp3'),"
+                " ('Other', 1, 'v2', 200, 2, null), ('Missing', 1, 'v3', 200, 3, null)"
+            )
+        # scaled without ffmpeg, as if an earlier track of the album had prepared it
+        cover = Cover(b"\xff\xd8scaled\xff\xd9")
+        version = get_cover_version(album_path)
+        cover_flight.do((album_path.joinpath("cover.jpg"), version), lambda: cover)
+        album: types.Album = {"path": "Album"}
+        embed_album_cover(album, 1, self.destination.joinpath("Artist"))
+        for track_path in (stored_path, legacy_path):
+            self.assertEqual([frame.data for frame in ID3(track_path).getall("APIC")], [cover.data])
+        self.assertEqual(database.get_album_cover(1), version)
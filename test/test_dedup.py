@@ -0,0 +1,71 @@
+from process.track import reuse_encoded_track
+from test.fixtures import MP3, DatabaseTestCase
+from util import database, types
+from util.convert_audio import Metadata, read_tags
+
+
+class TestDedup(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        types.Options.mp3 = False
+
+    def test(self) -> None:
+        self.insert_album(1, "Single", "Single")
+        self.insert_album(2, "Album: Deluxe")
+        self.insert_album(3, "Album", year=2021)
+        conn = database.get_connection()
+        with conn:
+            # inserted before the path was stored
+            conn.execute(
+                "insert into track (title, alid, video_id, duration, track_id)"
+                " values ('Song', 2, 'v1', 200, 3)"
+            )
+        track: types.Track = {"videoId": "v1", "title": "Song", "duration_seconds": 200}
+        single_path = self.destination.joinpath("Artist", "Single", "01 - Song.opus")
+        database.insert_track(1, track, 1, single_path)
+        album_path = self.destination.joinpath("Artist", "Album Deluxe")
+        self.assertEqual(
+            database.get_track_paths("v1", 3),
+            [
+                single_path,
+                album_path.joinpath("03 - Song.opus"),
+                album_path.joinpath("03 - Song.mp3"),
+            ],
+        )
+        self.assertEqual(database.get_track_paths("v1", 1)[0], album_path.joinpath("03 - Song.opus"))
+
+    def test_tags(self) -> None:
+        metadata = Metadata("Song", "Artist", "Album", "2020", 3, [{"name": "Artist", "id": "..."}])
+        tags: dict[str, str] = {
+            "title": "Song",
+            "album": "Album",
+            "date": "2020",
+            "tracknumber": "3",
+            "artist": "Artist",
+            "encoder": "Lavf",
+        }
+        self.assertTrue(metadata.matches_tags(tags))
+        self.assertFalse(metadata.matches_tags({**tags, "tracknumber": "1"}))
+        self.assertFalse(metadata.matches_tags({**tags, "album": "Single"}))
+
+    def test_reuse(self) -> None:
+        types.Options.mp3 = True
+        self.insert_album(1, "Single", "Single")
+        self.insert_album(2, "Album", year=2021, track_count=3)
+        source_path = self.destination.joinpath("Artist", "Single", "01 - Song.mp3")
+        source_path.parent.mkdir(parents=True)
+        source_path.write_bytes(MP3)
+        track: types.Track = {"videoId": "v1", "title": "Song", "duration_seconds": 200}
+        database.insert_track(1, track, 1, source_path)
+        track_path = self.destination.joinpath("Artist", "Album", "03 - Song.mp3")
+        track_path.parent.mkdir(parents=True)
+        metadata = Metadata("Song", "Artist", "Album", "2021", 3, [])
+        self.assertTrue(reuse_encoded_track("v1", 2, track_path, metadata))
+        self.assertTrue(metadata.matches_tags(read_tags(track_path)))
+        self.assertFalse(metadata.matches_tags(read_tags(source_path)))
+        # an existing track is kept, if the source can not be used
+        source_path.write_bytes(b"\0" * 1024)
+        track_path.write_bytes(b"existing")
+        self.assertFalse(reuse_encoded_track("v1", 2, track_path, metadata))
+        self.assertEqual(track_path.read_bytes(), b"existing")
+        self.assertEqual([path.name for path in track_path.parent.iterdir()], [track_path.name])
@@ -0,0 +1,28 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from process.journal import clean_temporary_files, get_download_prefix
+
+
+class TestJournal(unittest.TestCase):
+    def test(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            album_destination = Path(directory)
+            interrupted = album_destination.joinpath(f"{get_download_prefix(2)}Song.webm")
+            downloaded = album_destination.joinpath(f"{get_download_prefix(3)}Other.m4a")
+            foreign = album_destination.joinpath("2000.webm")
+            other_track = album_destination.joinpath(f"{get_download_prefix(23)}Third.webm")
+            track = album_destination.joinpath("02 - Song.opus")
+            for file in (interrupted, downloaded, foreign, other_track, track):
+                file.touch()
+            clean_temporary_files(
+                album_destination,
+                {get_download_prefix(2), get_download_prefix(3)},
+                {str(downloaded)},
+            )
+            self.assertFalse(interrupted.exists())
+            self.assertTrue(downloaded.exists())
+            self.assertTrue(foreign.exists())
+            self.assertTrue(other_track.exists())
+            self.assertTrue(track.exists())
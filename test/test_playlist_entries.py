@@ -0,0 +1,62 @@
+import unittest
+from process.util import AlbumPlaylist, parse_duration
+
+
+# raw playlist items, expected video id, expected title, expected duration
+ITEMS: list[tuple[dict, str, str, int]] = [
+    (
+        {
+            "playlistVideoRenderer": {
+                "videoId": "LbDb4Qc_NCU",
+                "title": {"runs": [{"text": "My Cosmos Is Mine"}]},
+                "lengthSeconds": "296",
+            }
+        },
+        "LbDb4Qc_NCU",
+        "My Cosmos Is Mine",
+        296,
+    ),
+    (
+        {
+            "lockupViewModel": {
+                "contentId": "2tQ0FDUYARM",
+                "contentType": "LOCKUP_CONTENT_TYPE_VIDEO",
+                "contentImage": {
+                    "thumbnailViewModel": {
+                        "overlays": [
+                            {
+                                "thumbnailOverlayBadgeViewModel": {
+                                    "thumbnailBadges": [
+                                        {"thumbnailBadgeViewModel": {"text": "4:01"}}
+                                    ]
+                                }
+                            }
+                        ]
+                    }
+                },
+                "metadata": {
+                    "lockupMetadataViewModel": {"title": {"content": "Wagging Tongue"}}
+                },
+            }
+        },
+        "2tQ0FDUYARM",
+        "Wagging Tongue",
+        241,
+    ),
+]
+
+
+class TestPlaylistEntries(unittest.TestCase):
+    def test(self) -> None:
+        playlist = AlbumPlaylist("https://www.youtube.com/playlist?list=...")
+        ids = playlist._extract_ids([item[0] for item in ITEMS])
+        self.assertEqual(ids, [f"/watch?v={item[1]}" for item in ITEMS])
+        for _, video_id, title, duration in ITEMS:
+            entry = playlist.get_entry(f"https://www.youtube.com/watch?v={video_id}")
+            self.assertEqual(entry["title"], title)
+            self.assertEqual(entry["duration_seconds"], duration)
+
+    def test_duration(self) -> None:
+        self.assertEqual(parse_duration("3:52"), 232)
+        self.assertEqual(parse_duration("1:02:03"), 3723)
+        self.assertIsNone(parse_duration("LIVE"))
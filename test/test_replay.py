@@ -0,0 +1,63 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from util.replay import Cassette, MissingResponse, replay_search
+
+
+class LiveSearch:
+    calls: int = 0
+
+    def __init__(self, query: str):
+        LiveSearch.calls += 1
+        self.query: str = query
+        self.responseSource: list = [{"first": query}, {"second": query}]
+
+    def result(self) -> dict:
+        return {"result": [{"title": self.query}]}
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path: Path = Path(self.directory.name).joinpath("cassette.json")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test(self) -> None:
+        calls: list[str] = []
+
+        def fetch() -> dict:
+            calls.append("fetch")
+            return {"value": 1}
+
+        cassette = Cassette(self.path, "auto")
+        self.assertEqual(cassette.get("kind", ["argument"], fetch), {"value": 1})
+        cassette.get("kind", ["argument"], fetch)["value"] = 2
+        self.assertEqual(cassette.get("kind", ["argument"], fetch), {"value": 1})
+        self.assertEqual(calls, ["fetch"])
+        cassette.save()
+        replay = Cassette(self.path, "replay")
+        self.assertEqual(replay.get("kind", ["argument"], fetch), {"value": 1})
+        with self.assertRaises(MissingResponse):
+            replay.get("kind", ["other"], fetch)
+        Cassette(self.path, "record").get("kind", ["argument"], fetch)
+        self.assertEqual(calls, ["fetch", "fetch"])
+
+    def test_search(self) -> None:
+        search = replay_search(Cassette(self.path, "auto"), "ChannelsSearch", LiveSearch)
+        for _ in range(2):
+            result = search("query")
+            self.assertEqual(result.result(), {"result": [{"title": "query"}]})
+            self.assertEqual(result.responseSource, [{"first": "query"}])
+        self.assertEqual(LiveSearch.calls, 1)
+
+    def test_invalid_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            Cassette(self.path, "invalid")
+
+    def test_default_mode(self) -> None:
+        with self.assertRaises(MissingResponse):
+            Cassette(self.path).get("kind", ["argument"], dict)
+        self.assertFalse(self.path.exists())
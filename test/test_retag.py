@@ -0,0 +1,62 @@
+import json
+import os
+
+from process.album import retag_tracks
+from test.fixtures import MP3, DatabaseTestCase
+from util import database, types
+from util.convert_audio import read_tags
+
+
+class TestRetag(DatabaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        types.Options.mp3 = True
+
+    def test(self) -> None:
+        album_path = self.destination.joinpath("Artist", "Album")
+        album_path.mkdir(parents=True)
+        stored_path = album_path.joinpath("01 - Song.mp3")
+        stored_path.write_bytes(MP3)
+        legacy_path = album_path.joinpath("02 - Other.mp3")
+        legacy_path.write_bytes(MP3)
+        old_tags = {"title": "Song", "album": "Album", "date": "2020", "tracknumber": "1"}
+        self.insert_album(1, "Album", track_count=2)
+        conn = database.get_connection()
+        with conn:
+            conn.execute(
+                "insert into track (tid, title, alid, video_id, duration, track_id, path, tags)"
+                " values (1, 'Song', 1, 'v1', 200, 1, ?, ?),"
+                " (2, 'Other', 1, 'v2', 200, 2, null, null)",
+                (os.path.join("Artist", "Album", "01 - Song.mp3"), json.dumps(old_tags)),
+            )
+        album: types.Album = {
+            "title": "Album (Remastered)",
+            "year": "2021",
+            "path": "Album",
+            "tracks": [
+                {"videoId": "v1", "title": "Song", "artists": []},
+                {"videoId": "v2", "title": "Other", "artists": []},
+            ],
+        }
+        artist: types.Artist = {"name": "Artist"}
+        retag_tracks(album, artist, 1, self.destination.joinpath("Artist"))
+        new_tags = {"title": "Song", "album": "Album (Remastered)", "date": "2021", "tracknumber": "1"}
+        self.assertEqual(read_tags(stored_path), new_tags)
+        self.assertEqual(read_tags(legacy_path)["tracknumber"], "2")
+        stored = database.get_track_tags(1)
+        self.assertEqual(stored["v1"][4], new_tags)
+        self.assertEqual(stored["v2"][4], {**new_tags, "title": "Other", "tracknumber": "2"})
+
+    def test_artist_name(self) -> None:
+        artist: types.Artist = {
+            "name": "Artist",
+            "channelId": "UC1",
+            "topic_channel_id": "UC1",
+            "description": None,
+            "path": "Artist",
+        }
+        database.insert_artist(artist, False)
+        database.insert_artist({**artist, "name": "Renamed"}, False)
+        self.insert_album(1, "Album")
+        # albums updated by the daemon are tagged with the name of the last artist update
+        self.assertEqual(database.get_album_artist(1)[0]["name"], "Renamed")
@@ -0,0 +1,55 @@
+import time
+
+from process.combined import MAX_RETRY_INTERVAL, classify_error, record_failure
+from test.fixtures import DatabaseTestCase
+from util import database, types
+
+
+class TestRetry(DatabaseTestCase):
+    def get_failure(self, video_id: str) -> tuple[str, int, int]:
+        """:return: the error class, attempts and seconds until the next attempt"""
+        conn = database.get_connection()
+        with conn:
+            error_class, attempts, next_attempt = conn.execute(
+                "select error_class, attempts, next_attempt from failed_track where video_id = ?",
+                (video_id,),
+            ).fetchone()
+        return error_class, attempts, next_attempt - int(time.time())
+
+    def test_classify_error(self) -> None:
+        self.assertEqual(classify_error("Did not find any matching video at all"), "no video")
+        self.assertEqual(classify_error("Age restricted"), "age restricted")
+        self.assertEqual(classify_error("SABR Maximum reload attempts reached"), "sabr")
+        self.assertEqual(classify_error("Failed assertion measured I out of range"), "assertion")
+        self.assertEqual(classify_error("Traceback (most recent call last): ..."), "other")
+
+    def test_backoff(self) -> None:
+        self.insert_album(1, "Album", track_count=2)
+        other: types.Track = {"videoId": "v1", "title": "Song"}
+        for attempt in range(1, 4):
+            record_failure(1, other, "Traceback (most recent call last): ...")
+            error_class, attempts, delay = self.get_failure("v1")
+            self.assertEqual((error_class, attempts), ("other", attempt))
+            # doubles with every attempt, starting at an hour
+            self.assertAlmostEqual(delay, 60 * 60 * 2 ** (attempt - 1), delta=2)
+        for _ in range(20):
+            record_failure(1, other, "Traceback (most recent call last): ...")
+        self.assertAlmostEqual(self.get_failure("v1")[2], MAX_RETRY_INTERVAL, delta=2)
+        no_video: types.Track = {"videoId": "v2", "title": "Other"}
+        for _ in range(2):
+            record_failure(1, no_video, "Did not find any matching video at all")
+        # permanent errors do not double
+        self.assertAlmostEqual(self.get_failure("v2")[2], 30 * 24 * 60 * 60, delta=2)
+
+    def test_postponed_tracks(self) -> None:
+        self.insert_album(1, "Album", track_count=2)
+        for video_id in ("v1", "v2"):
+            record_failure(1, {"videoId": video_id, "title": video_id}, "Age restricted")
+        self.assertEqual(database.get_postponed_tracks(1), {"v1", "v2"})
+        conn = database.get_connection()
+        with conn:
+            conn.execute("update failed_track set next_attempt = 0 where video_id = 'v1'")
+        # due for a retry
+        self.assertEqual(database.get_postponed_tracks(1), {"v2"})
+        database.delete_failed_track(1, "v2")
+        self.assertEqual(database.get_postponed_tracks(1), set())
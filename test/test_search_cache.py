@@ -0,0 +1,64 @@
+import threading
+import time
+import unittest
+
+from test.fixtures import DatabaseTestCase
+from util import database, types
+from util.cache import SingleFlight, cached_search
+
+
+class TestSearchCache(DatabaseTestCase):
+    def test(self) -> None:
+        calls: list[str] = []
+
+        def search() -> list[str]:
+            calls.append("search")
+            return ["result"]
+
+        self.assertEqual(cached_search("video", "query", search), ["result"])
+        self.assertEqual(cached_search("video", "query", search), ["result"])
+        self.assertEqual(cached_search("channel", "query", search), ["result"])
+        self.assertEqual(len(calls), 2, "Cached search has been repeated")
+
+    def test_eviction(self) -> None:
+        types.Options.search_cache_size = 2
+        for query in ("a", "b", "c"):
+            cached_search("video", query, lambda: [query])
+        self.assertIsNone(database.get_cached_search("video", "a", 0))
+        self.assertEqual(database.get_cached_search("video", "c", 0), '["c"]')
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test(self) -> None:
+        flight = SingleFlight()
+        calls: list[int] = []
+
+        def slow() -> int:
+            calls.append(1)
+            time.sleep(0.1)
+            return 42
+
+        results: list[int] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(len(calls), 1, "Concurrent calls have not been merged")
+
+    def test_memoize(self) -> None:
+        flight = SingleFlight(memoize=True)
+        calls: list[int] = []
+
+        def call() -> int:
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(flight.do("key", call), 1)
+        self.assertEqual(flight.do("key", call), 1)
+        flight.max_age = 0
+        self.assertEqual(flight.do("key", call), 2, "Result has not expired")
@@ -1,6 +1,7 @@
 import unittest
 from util.types import Artist, AlbumResults, SingleResults
 from process.artist import get_topic_channel_id
+from test import use_cassette
 
 
 def get_artist(name: str, channel_id: str, topic_channel: str) -> Artist:
@@ -36,11 +37,12 @@ ARTISTS: list[tuple[str, str, str]] = [
 
 class TestTopicChannelSearch(unittest.TestCase):
     def test(self) -> None:
-        for artist_data in ARTISTS:
-            artist: Artist = get_artist(*artist_data)
-            found_topic_channel: str = get_topic_channel_id(artist)
-            self.assertEqual(
-                artist["topic_channel_id"],
-                found_topic_channel,
-                f'Expected topic channel id "{artist["topic_channel_id"]}", found id "{found_topic_channel}" for artist {artist["name"]}.',
-            )
+        with use_cassette("topic_channel_search.json"):
+            for artist_data in ARTISTS:
+                artist: Artist = get_artist(*artist_data)
+                found_topic_channel: str = get_topic_channel_id(artist)
+                self.assertEqual(
+                    artist["topic_channel_id"],
+                    found_topic_channel,
+                    f'Expected topic channel id "{artist["topic_channel_id"]}", found id "{found_topic_channel}" for artist {artist["name"]}.',
+                )
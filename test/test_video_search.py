@@ -1,5 +1,6 @@
 import unittest
 from process.track import get_alternative_track_id
+from test import use_cassette
 from util.types import Track, Album, Artist, AlbumResults, SingleResults
 
 
@@ -93,8 +94,9 @@ VIDEOS: list[tuple[str, str, str, str, str]] = [
 
 class TestVideoSearch(unittest.TestCase):
     def test(self) -> None:
-        for video_data in VIDEOS:
-            print(f"Testing {video_data}")
-            track, album, artist = get_track_album_artist(*video_data)
-            video_id = get_alternative_track_id(track, album, artist)
-            self.assertEqual(video_id, video_data[4], "Invalid video found")
+        with use_cassette("video_search.json"):
+            for video_data in VIDEOS:
+                print(f"Testing {video_data}")
+                track, album, artist = get_track_album_artist(*video_data)
+                video_id = get_alternative_track_id(track, album, artist)
+                self.assertEqual(video_id, video_data[4], "Invalid video found")
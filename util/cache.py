@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Optional, TypeVar
+
+from util import types, database, metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Merges concurrent calls with the same key into a single call, all callers
+    receive the result (or exception) of that call.
+    If memoize is set, successful results are also returned for later calls,
+    until they are older than max_age seconds (if set).
+    """
+
+    def __init__(self, memoize: bool = False, max_age: Optional[float] = None):
+        self.lock = threading.Lock()
+        self.in_flight: dict[Hashable, Future] = {}
+        self.memoize: bool = memoize
+        self.max_age: Optional[float] = max_age
+        self.results: dict[Hashable, tuple[float, Any]] = {}
+
+    def expire(self):
+        """drops memoized results older than max_age, needs to hold the lock"""
+        if self.max_age is None:
+            return
+        oldest: float = time.monotonic() - self.max_age
+        for key in [key for key, (created, _) in self.results.items() if created < oldest]:
+            del self.results[key]
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        with self.lock:
+            if self.memoize:
+                self.expire()
+                if key in self.results:
+                    return self.results[key][1]
+            future: Future = self.in_flight.get(key)
+            owner: bool = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            result: T = function()
+            if self.memoize:
+                with self.lock:
+                    self.results[key] = (time.monotonic(), result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+
+search_flight = SingleFlight()
+
+
+def cached_search(kind: str, query: str, search: Callable[[], Any]) -> Any:
+    """
+    Returns the result of a search from the library database, if it has been
+    issued within the ttl, otherwise searches and stores the result
+    :param kind: the kind of search, queries are only shared within the same kind
+    :param query: the query identifying the search
+    :param search: performs the search, its result needs to be json serializable
+    """
+
+    def load() -> Any:
+        ttl: int = types.Options.search_cache_ttl
+        if ttl <= 0 or not database.is_initialized():
+            return search()
+        cached = database.get_cached_search(kind, query, int(time.time()) - ttl)
+        if cached is not None:
+            metrics.count("search_cache_hits")
+            return json.loads(cached)
+        metrics.count("search_cache_misses")
+        result = search()
+        database.put_cached_search(
+            kind, query, json.dumps(result), types.Options.search_cache_size
+        )
+        return result
+
+    return search_flight.do((kind, query), load)
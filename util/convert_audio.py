@@ -1,8 +1,11 @@
 from pathlib import Path
-from subprocess import Popen, PIPE
-from util import types
+from subprocess import Popen, PIPE, DEVNULL, run
+from threading import Thread
+from util import types, metrics
+from mutagen import File, MutagenError
 from mutagen.flac import Picture
-from mutagen.id3 import PictureType
+from mutagen.id3 import APIC, ID3, ID3NoHeaderError, PictureType
+from mutagen.oggopus import OggOpus
 from base64 import b64encode
 from json import loads
 from ffmpeg import probe
@@ -14,6 +17,9 @@ INTENDED_I: float = -16.0
 INTENDED_TP: float = -1.0
 INTENDED_LRA: float = 20.0
 NICE_CMD: List[str] = ["nice", "-n", "19"]
+LOUDNORM_ANALYSIS: str = (
+    f"loudnorm=I={INTENDED_I}:TP={INTENDED_TP}:LRA={INTENDED_LRA}:print_format=json"
+)
 
 
 class Metadata:
@@ -40,7 +46,6 @@ class Metadata:
         album: types.Album,
         artist: types.Artist,
     ):
-        thumbnail: types.Thumbnail = album["thumbnails"][-1]
         return Metadata(
             track["title"],
             artist["name"],
@@ -48,84 +53,194 @@ class Metadata:
             album.get("year", "0"),
             track_id,
             track["artists"],
-            thumbnail["width"],
-            thumbnail["height"],
         )
 
-    def for_ffmpeg(self) -> list[str]:
-        all_attributes: dict[str, str] = {
-            "TITLE": self.title,
-            "ALBUM": self.album,
-            "DATE": self.year,
-            "TRACKNUMBER": self.track,
+    @staticmethod
+    def from_job(job: types.TrackJob):
+        return Metadata(
+            job.track["title"],
+            job.artist_name,
+            job.album_title,
+            job.album_year,
+            job.track_index + 1,
+            job.track["artists"],
+        )
+
+    def tags(self) -> dict[str, str]:
+        """:return: the tags of the track, with the lower case names used by read_tags"""
+        tags: dict[str, str] = {
+            "title": self.title,
+            "album": self.album,
+            "date": self.year,
+            "tracknumber": self.track,
         }
-        if types.Options.mp3:
-            new_attributes: dict[str, str] = {}
-            for key, value in all_attributes.items():
-                name: str = key.lower().replace("tracknumber", "track")
-                new_attributes[name] = value
-            all_attributes = new_attributes
-        result = []
-        for name, value in all_attributes.items():
-            result.append("-metadata")
-            result.append(f"{name}={value}")
         if not types.Options.mp3:
             if all(self.artist.lower() not in artist["name"].lower() for artist in self.artists):
                 self.artists.insert(0, {"name": self.artist})
-            artist = ', '.join(artist["name"] for artist in self.artists)
+            tags["artist"] = ', '.join(artist["name"] for artist in self.artists)
+        return tags
+
+    def for_ffmpeg(self) -> list[str]:
+        result = []
+        for name, value in self.tags().items():
+            if types.Options.mp3:
+                name = name.replace("tracknumber", "track")
+            else:
+                name = name.upper()
             result.append("-metadata")
-            result.append(f'ARTIST={artist}')
+            result.append(f"{name}={value}")
         return result
 
+    def matches_tags(self, tags: dict[str, str]) -> bool:
+        """whether the tags read by read_tags are the ones, that would be written"""
+        return all(tags.get(name) == value for name, value in self.tags().items())
 
-def level_and_combine_audio(
-    tmp_file: str,
-    track_path: Path,
-    metadata: Metadata,
-    seek: Optional[str] = None,
-    end: Optional[str] = None,
-) -> bool:
-    input_modifiers: List[str] = []
-    if seek:
-        input_modifiers.extend(("-ss", seek))
-    if end:
-        input_modifiers.extend(("-to", end))
-    audio_level_command = [
+
+class StreamMetadata:
+    def __init__(self, sample_rate: Optional[str], bit_rate: Optional[str]):
+        self.sample_rate: Optional[str] = sample_rate
+        self.bit_rate: Optional[str] = bit_rate
+
+    @staticmethod
+    def from_probe(tmp_file: str):
+        with metrics.timer("ffprobe"):
+            input_metadata = probe(tmp_file)
+        stream = input_metadata["streams"][0]
+        return StreamMetadata(
+            stream["sample_rate"], input_metadata["format"]["bit_rate"]
+        )
+
+    def is_complete(self) -> bool:
+        return bool(self.sample_rate and self.bit_rate)
+
+
+def get_analysis_command(source: str, input_modifiers: List[str]) -> List[str]:
+    return [
         *NICE_CMD,
         "ffmpeg",
         "-hide_banner",
         *input_modifiers,
         "-i",
-        tmp_file,
+        source,
         "-af",
-        f"loudnorm=I={INTENDED_I}:TP={INTENDED_TP}:LRA={INTENDED_LRA}:print_format=json",
+        LOUDNORM_ANALYSIS,
         "-f",
         "null",
         "-",
     ]
-    input_metadata = probe(tmp_file)
-    stream = input_metadata["streams"][0]
-    sample_rate = stream["sample_rate"]
-    bit_rate = input_metadata["format"]["bit_rate"]
-    output_lines = Popen(
-        audio_level_command, universal_newlines=True, stdout=PIPE, stderr=PIPE
-    )
-    output_lines = output_lines.communicate()[1].split("\n")
+
+
+def parse_loudness(analysis_output: str) -> dict[str, str]:
+    output_lines = analysis_output.split("\n")
     json = loads("\n".join(output_lines[-13:-1]))
     assert -99 <= float(json["input_i"]) <= 0, "measured I out of range"
     assert 0 <= float(json["input_lra"]) <= 99, "measured LRA out of range"
     assert -99 <= float(json["input_tp"]) <= 99, "measured TP out of range"
     assert -99 <= float(json["input_thresh"]) <= 0, "measured thresh out of range"
     assert -99 <= float(json["target_offset"]) <= 99, "target offset out of range"
+    return json
+
+
+def measure_loudness(tmp_file: str, input_modifiers: List[str]) -> dict[str, str]:
+    with metrics.timer("loudness_analysis"):
+        output_lines = Popen(
+            get_analysis_command(tmp_file, input_modifiers),
+            universal_newlines=True,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        analysis_output: str = output_lines.communicate()[1]
+    return parse_loudness(analysis_output)
+
+
+class StreamingLoudnessAnalysis:
+    """
+    Runs the loudnorm measurement pass on the bytes of a download while they
+    arrive, so only the encode pass is left once the download has finished.
+    """
+
+    def __init__(self):
+        self.process = Popen(
+            get_analysis_command("pipe:0", []),
+            stdin=PIPE,
+            stdout=DEVNULL,
+            stderr=PIPE,
+        )
+        self.fed: bool = False
+        self.failed: bool = False
+        self.output: str = ""
+        # stderr needs to be drained while feeding, otherwise ffmpeg might block
+        self.reader: Thread = Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self):
+        self.output = self.process.stderr.read().decode(errors="replace")
+
+    def feed(self, chunk: bytes):
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(chunk)
+            self.fed = True
+        except OSError:
+            # ffmpeg gave up on the input, the file will be analyzed afterward
+            self.failed = True
+
+    def abort(self):
+        self.failed = True
+        self.process.kill()
+        self.finish()
+
+    def finish(self) -> Optional[dict[str, str]]:
+        try:
+            self.process.stdin.close()
+        except OSError:
+            self.failed = True
+        self.process.wait()
+        self.reader.join()
+        if self.failed or not self.fed or self.process.returncode != 0:
+            return None
+        try:
+            return parse_loudness(self.output)
+        except (ValueError, KeyError, AssertionError):
+            return None
+
+
+def level_and_combine_audio(
+    tmp_file: str,
+    track_path: Path,
+    metadata: Metadata,
+    seek: Optional[str] = None,
+    end: Optional[str] = None,
+    loudness: Optional[dict[str, str]] = None,
+    stream_metadata: Optional[StreamMetadata] = None,
+) -> bool:
+    input_modifiers: List[str] = []
+    if seek:
+        input_modifiers.extend(("-ss", seek))
+    if end:
+        input_modifiers.extend(("-to", end))
+    if not stream_metadata or not stream_metadata.is_complete():
+        # only spawn ffprobe if the stream manifest did not provide everything
+        stream_metadata = StreamMetadata.from_probe(tmp_file)
+    sample_rate = stream_metadata.sample_rate
+    bit_rate = stream_metadata.bit_rate
+    json = loudness or measure_loudness(tmp_file, input_modifiers)
+    profile: types.EncoderProfile = types.ENCODER_PROFILES[types.Options.encoder_profile]
     loudnorm = (
         f"loudnorm=I={INTENDED_I}:TP={INTENDED_TP}:LRA={INTENDED_LRA}:"
         f'measured_I={json["input_i"]}:measured_LRA={json["input_lra"]}:'
         f'measured_TP={json["input_tp"]}:measured_thresh={json["input_thresh"]}:'
         f'offset={json["target_offset"]}:linear=true,'
-        f"aresample=resampler=soxr:out_sample_rate={sample_rate}:precision=33,"
+        f"aresample=resampler=soxr:out_sample_rate={sample_rate}"
+        f":precision={profile['resampler_precision']},"
         "aformat=channel_layouts=stereo"
     )
     codec = "libmp3lame" if types.Options.mp3 else "libopus"
+    # both encoders map their speed/quality trade-off to the compression level
+    compression_level: int = (
+        profile["lame_quality"] if types.Options.mp3 else profile["opus_complexity"]
+    )
     audio_extract_command = [
         *NICE_CMD,
         "ffmpeg",
@@ -139,12 +254,115 @@ def level_and_combine_audio(
         loudnorm,
         "-c:a",
         codec,
+        "-compression_level",
+        str(compression_level),
         "-b:a",
         bit_rate,
         "-vn",
         *metadata.for_ffmpeg(),
         str(track_path),
     ]
-    extract = Popen(audio_extract_command)
-    extract.wait()
+    with metrics.timer("encode"):
+        extract = Popen(audio_extract_command)
+        extract.wait()
     return extract.returncode == 0
+
+
+def read_tags(track_path: Path) -> dict[str, str]:
+    """:return: the first value of every tag, with lower case names"""
+    try:
+        audio = File(track_path, easy=True)
+    except (MutagenError, OSError):
+        return {}
+    if audio is None or audio.tags is None:
+        return {}
+    tags: dict[str, str] = {}
+    for name in audio.tags.keys():
+        if values := audio.tags[name]:
+            tags[name.lower()] = values[0]
+    return tags
+
+
+def write_tags(track_path: Path, metadata: Metadata) -> bool:
+    """rewrites the tags of an encoded track in place, without encoding it again"""
+    try:
+        audio = File(track_path, easy=True)
+        if audio is None:
+            return False
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in metadata.tags().items():
+            audio[name] = value
+        with metrics.timer("retag"):
+            audio.save()
+    except (MutagenError, OSError):
+        return False
+    return True
+
+
+class Cover:
+    """An album cover, with the picture blocks built once for all tracks of the album"""
+
+    def __init__(self, data: bytes):
+        self.data: bytes = data
+        picture = Picture()
+        picture.type = PictureType.COVER_FRONT
+        picture.mime = "image/jpeg"
+        picture.desc = "Cover"
+        picture.data = data
+        # opus stores flac picture blocks base64 encoded in a comment
+        self.block: str = b64encode(picture.write()).decode("ascii")
+        self.frame: APIC = APIC(
+            encoding=3, mime="image/jpeg", type=PictureType.COVER_FRONT, desc="Cover", data=data
+        )
+
+
+def scale_cover(cover_path: Path, size: int) -> Optional[bytes]:
+    """:return: the cover as jpeg, scaled down to fit into size x size pixels"""
+    scale_command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        str(cover_path),
+        "-vf",
+        f"scale=w='min(iw,{size})':h='min(ih,{size})':force_original_aspect_ratio=decrease",
+        "-frames:v",
+        "1",
+        "-q:v",
+        "2",
+        "-f",
+        "mjpeg",
+        "pipe:1",
+    ]
+    with metrics.timer("cover_scale"):
+        scaled = run(scale_command, stdout=PIPE, stderr=DEVNULL)
+    if scaled.returncode != 0 or not scaled.stdout:
+        return None
+    return scaled.stdout
+
+
+def embed_cover(track_path: Path, cover: Cover) -> bool:
+    """embeds the cover into an encoded track, without encoding it again"""
+    try:
+        if track_path.suffix == ".mp3":
+            try:
+                tags = ID3(track_path)
+            except ID3NoHeaderError:
+                tags = ID3()
+            if any(frame.data == cover.data for frame in tags.getall("APIC")):
+                return True
+            tags.delall("APIC")
+            tags.add(cover.frame)
+            with metrics.timer("cover_embed"):
+                tags.save(track_path)
+        else:
+            audio = OggOpus(track_path)
+            if audio.get("METADATA_BLOCK_PICTURE") == [cover.block]:
+                return True
+            audio["METADATA_BLOCK_PICTURE"] = [cover.block]
+            with metrics.timer("cover_embed"):
+                audio.save()
+    except (MutagenError, OSError):
+        return False
+    return True
@@ -1,14 +1,23 @@
+import json
 import sqlite3
 import pathlib
 import threading
-from util import types
+from pathvalidate import sanitize_filename
+from util import types, metrics
+from util.io import get_track_filename
 from typing import Optional
 import os
-import psutil
 import time
 
-db_path: pathlib.Path
+db_path: Optional[pathlib.Path] = None
 thread_local = threading.local()
+# columns added to existing tables later on: table, column, definition
+ADDED_COLUMNS: list[tuple[str, str, str]] = [
+    ("artist", "fingerprint", "text"),
+    ("track", "path", "text"),
+    ("track", "tags", "text"),
+    ("album", "cover", "text"),
+]
 
 
 def get_connection() -> sqlite3.Connection:
@@ -19,6 +28,10 @@ def get_connection() -> sqlite3.Connection:
     return conn
 
 
+def is_initialized() -> bool:
+    return db_path is not None
+
+
 def init(path: pathlib.Path):
     global db_path
     db_path = path
@@ -34,7 +47,8 @@ create table if not exists artist (
     description text,
     singles integer not null,
     path text not null unique,
-    last_update integer not null default 0
+    last_update integer not null default 0,
+    fingerprint text
 );
 create table if not exists album (
     alid integer primary key,
@@ -46,6 +60,7 @@ create table if not exists album (
     duration integer not null,
     path text not null,
     last_update integer not null default 0,
+    cover text,
     unique (path, aid)
 );
 create table if not exists track (
@@ -54,15 +69,53 @@ create table if not exists track (
     alid integer not null references album on delete cascade,
     video_id text not null,
     duration integer not null,
-    track_id integer not null
+    track_id integer not null,
+    path text,
+    tags text
+);
+create table if not exists failed_track (
+    alid integer not null references album on delete cascade,
+    video_id text not null,
+    error_class text not null,
+    attempts integer not null,
+    next_attempt integer not null,
+    error text,
+    primary key (alid, video_id)
+);
+create table if not exists job (
+    alid integer not null references album on delete cascade,
+    video_id text not null,
+    job text not null,
+    state text not null default 'pending',
+    tmp_path text,
+    updated integer not null,
+    primary key (alid, video_id)
 );
 create table if not exists daemon (
     pid integer primary key
 );
+create table if not exists search_cache (
+    kind text not null,
+    query text not null,
+    result text not null,
+    created integer not null,
+    last_used integer not null,
+    primary key (kind, query)
+);
 create index if not exists artist_last_updated on artist (last_update);
 create index if not exists album_last_updated on album (last_update);
+create index if not exists search_cache_last_used on search_cache (last_used);
         """
         )
+        add_missing_columns(conn)
+        conn.execute("create index if not exists track_video_id on track (video_id)")
+
+
+def add_missing_columns(conn: sqlite3.Connection):
+    for table, column, definition in ADDED_COLUMNS:
+        columns = [row[1] for row in conn.execute(f"pragma table_info({table})")]
+        if column not in columns:
+            conn.execute(f"alter table {table} add column {column} {definition}")
 
 
 def get_unique_artist_path(artist: types.Artist) -> str:
@@ -81,7 +134,7 @@ def get_unique_artist_path(artist: types.Artist) -> str:
 
 def insert_artist(artist: types.Artist, no_singles: bool) -> int:
     conn = get_connection()
-    with conn:
+    with metrics.timer("db_write"), conn:
         cur = conn.cursor()
         cur.execute(
             "select aid from artist where channel_id = ?", (artist["channelId"],)
@@ -108,10 +161,11 @@ def insert_artist(artist: types.Artist, no_singles: bool) -> int:
             cur.execute(
                 """
                 update artist
-                    set singles = ?
+                    set singles = ?, name = ?
                 where aid = ?
             """,
-                (int(not no_singles), aid[0]),
+                # tracks are tagged with the stored name, when their album is updated alone
+                (int(not no_singles), artist["name"], aid[0]),
             )
     return aid[0]
 
@@ -134,6 +188,23 @@ def get_artist(channel_id: str) -> int:
     return aid[0]
 
 
+def get_artist_fingerprint(channel_id: str) -> Optional[str]:
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("select fingerprint from artist where channel_id = ?", (channel_id,))
+        fingerprint = cur.fetchone()
+    return fingerprint[0] if fingerprint else None
+
+
+def update_artist_fingerprint(channel_id: str, fingerprint: str):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            "update artist set fingerprint = ? where channel_id = ?",
+            (fingerprint, channel_id),
+        )
+
+
 def get_least_recently_updated_artist() -> Optional[tuple[int, str]]:
     conn = get_connection()
     with conn:
@@ -142,9 +213,17 @@ def get_least_recently_updated_artist() -> Optional[tuple[int, str]]:
     return aid
 
 
+def schedule_artist_update(channel_id: str) -> bool:
+    """:return: whether the artist is known"""
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        cur = conn.execute("update artist set last_update = 0 where channel_id = ?", (channel_id,))
+        return cur.rowcount > 0
+
+
 def update_artist(aid: int):
     conn = get_connection()
-    with conn:
+    with metrics.timer("db_write"), conn:
         conn.execute("update artist set last_update = strftime('%s', 'now') where aid = ?", (aid,))
 
 
@@ -167,7 +246,7 @@ def get_unique_album_path(album: types.Album, artist: types.Artist) -> str:
 
 def insert_album(album: types.Album, artist: types.Artist) -> int:
     conn = get_connection()
-    with conn:
+    with metrics.timer("db_write"), conn:
         cur = conn.cursor()
         cur.execute("select alid from album where browse_id = ?", (album["browseId"],))
         alid = cur.fetchone()
@@ -193,6 +272,33 @@ def insert_album(album: types.Album, artist: types.Artist) -> int:
     return alid[0]
 
 
+def get_album_track_count(alid: int) -> int:
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("select track_count from album where alid = ?", (alid,))
+        return cur.fetchone()[0]
+
+
+def get_album_cover(alid: int) -> Optional[str]:
+    """:return: the version of the cover, that is embedded into every downloaded track"""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("select cover from album where alid = ?", (alid,))
+        return cur.fetchone()[0]
+
+
+def update_album_cover(alid: int, cover: str):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute("update album set cover = ? where alid = ?", (cover, alid))
+
+
+def update_album_track_count(alid: int, track_count: int):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute("update album set track_count = ? where alid = ?", (track_count, alid))
+
+
 def get_album_info(alid: int) -> tuple[str, str, str]:
     conn = get_connection()
     with conn:
@@ -220,7 +326,7 @@ def get_least_recently_updated_album() -> Optional[tuple[int, int]]:
 
 def update_album(alid: int, infinite: bool = False):
     conn = get_connection()
-    with conn:
+    with metrics.timer("db_write"), conn:
         target: int = 2**60 if infinite else int(time.time())
         conn.execute("update album set last_update = ? where alid = ?", (target, alid))
 
@@ -263,6 +369,37 @@ def get_tracks_for_album(alid: int) -> list[str]:
     return [i[0] for i in res]
 
 
+def get_library_tracks() -> list[tuple[int, int, str, int, int, str, str]]:
+    """
+    :return: tid, alid, title, duration, track number, artist path and album path
+        of every downloaded track
+    """
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            """
+        select track.tid, track.alid, track.title, track.duration, track.track_id,
+            artist.path, album.path
+        from track
+        join album on album.alid = track.alid
+        join artist on artist.aid = album.aid
+        """
+        )
+        return cur.fetchall()
+
+
+def requeue_tracks(tids: list[int]):
+    """forgets downloaded tracks, so they are downloaded again with the next update of their album"""
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        for tid in tids:
+            conn.execute(
+                "update album set last_update = 0 where alid = (select alid from track where tid = ?)",
+                (tid,),
+            )
+            conn.execute("delete from track where tid = ?", (tid,))
+
+
 def get_video_id_for_track(track: types.Track) -> str:
     video_id: str = track["videoId"]
     if not video_id:
@@ -271,9 +408,53 @@ def get_video_id_for_track(track: types.Track) -> str:
     return video_id
 
 
-def insert_track(alid: int, track: types.Track, track_id: int) -> int:
+def get_track_paths(video_id: str, alid: int) -> list[pathlib.Path]:
+    """
+    :return: the possible paths of the same video encoded for other albums,
+        the files might not exist (anymore)
+    """
     conn = get_connection()
     with conn:
+        cur = conn.execute(
+            """
+        select track.path, artist.path, album.path, track.track_id, track.title
+        from track
+        join album on album.alid = track.alid
+        join artist on artist.aid = album.aid
+        where track.video_id = ? and track.alid != ?
+        order by track.path is null
+        """,
+            (video_id, alid),
+        )
+        rows = cur.fetchall()
+    library: pathlib.Path = db_path.parent
+    paths: list[pathlib.Path] = []
+    for path, artist_path, album_path, track_id, title in rows:
+        if path:
+            paths.append(library.joinpath(path))
+            continue
+        # tracks inserted before the path was stored
+        album_directory: pathlib.Path = library.joinpath(
+            sanitize_filename(artist_path), sanitize_filename(album_path)
+        )
+        for extension in ("opus", "mp3"):
+            paths.append(album_directory.joinpath(get_track_filename(track_id, title, extension)))
+    return paths
+
+
+def insert_track(
+    alid: int,
+    track: types.Track,
+    track_id: int,
+    path: Optional[pathlib.Path] = None,
+    tags: Optional[dict[str, str]] = None,
+) -> int:
+    """
+    :param path: the encoded file, to be reused for the same track on other albums
+    :param tags: the tags written to the file, to find tracks that need to be retagged
+    """
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
         video_id: str = get_video_id_for_track(track)
         cur = conn.cursor()
         cur.execute(
@@ -283,8 +464,8 @@ def insert_track(alid: int, track: types.Track, track_id: int) -> int:
         if not tid:
             cur.execute(
                 """
-            insert into track (title, alid, video_id, duration, track_id)
-            values (?, ?, ?, ? ,?)
+            insert into track (title, alid, video_id, duration, track_id, path, tags)
+            values (?, ?, ?, ?, ?, ?, ?)
             returning tid
             """,
                 (
@@ -293,12 +474,201 @@ def insert_track(alid: int, track: types.Track, track_id: int) -> int:
                     video_id,
                     track.get("duration_seconds", -1),
                     track_id,
+                    os.path.relpath(path, db_path.parent) if path else None,
+                    json.dumps(tags) if tags else None,
                 ),
             )
             tid = cur.fetchone()
     return tid[0]
 
 
+def get_track_tags(
+    alid: int,
+) -> dict[str, tuple[int, int, str, Optional[pathlib.Path], Optional[dict[str, str]]]]:
+    """
+    :return: the tid, track number, title, file and written tags of every
+        downloaded track of an album, by video id. File and tags are only known
+        for tracks inserted since they are stored.
+    """
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "select video_id, tid, track_id, title, path, tags from track where alid = ?",
+            (alid,),
+        )
+        rows = cur.fetchall()
+    return {
+        video_id: (
+            tid,
+            track_id,
+            title,
+            db_path.parent.joinpath(path) if path else None,
+            json.loads(tags) if tags else None,
+        )
+        for video_id, tid, track_id, title, path, tags in rows
+    }
+
+
+def update_track_tags(tid: int, tags: dict[str, str]):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute("update track set tags = ? where tid = ?", (json.dumps(tags), tid))
+
+
+def forget_track_tags(tids: list[int]):
+    """lets the next update of their album check and rewrite the tags of the tracks"""
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        for tid in tids:
+            conn.execute(
+                "update album set last_update = 0 where alid = (select alid from track where tid = ?)",
+                (tid,),
+            )
+            conn.execute("update track set tags = null where tid = ?", (tid,))
+
+
+def get_cached_search(kind: str, query: str, min_created: int) -> Optional[str]:
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "select result from search_cache where kind = ? and query = ? and created >= ?",
+            (kind, query, min_created),
+        )
+        result = cur.fetchone()
+        if result:
+            conn.execute(
+                "update search_cache set last_used = strftime('%s', 'now') where kind = ? and query = ?",
+                (kind, query),
+            )
+    return result[0] if result else None
+
+
+def put_cached_search(kind: str, query: str, result: str, max_entries: int):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            """
+        insert or replace into search_cache (kind, query, result, created, last_used)
+        values (?, ?, ?, strftime('%s', 'now'), strftime('%s', 'now'))
+        """,
+            (kind, query, result),
+        )
+        # evict the least recently used searches
+        conn.execute(
+            """
+        delete from search_cache where rowid in (
+            select rowid from search_cache order by last_used desc, rowid desc limit -1 offset ?
+        )
+        """,
+            (max_entries,),
+        )
+
+
+def get_failed_track_attempts(alid: int, video_id: str) -> int:
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "select attempts from failed_track where alid = ? and video_id = ?",
+            (alid, video_id),
+        )
+        attempts = cur.fetchone()
+    return attempts[0] if attempts else 0
+
+
+def insert_failed_track(
+    alid: int,
+    video_id: str,
+    error_class: str,
+    error: str,
+    attempts: int,
+    next_attempt: int,
+):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            """
+        insert or replace into failed_track (alid, video_id, error_class, attempts, next_attempt, error)
+        values (?, ?, ?, ?, ?, ?)
+        """,
+            (alid, video_id, error_class, attempts, next_attempt, error),
+        )
+
+
+def delete_failed_track(alid: int, video_id: str):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            "delete from failed_track where alid = ? and video_id = ?", (alid, video_id)
+        )
+
+
+def get_postponed_tracks(alid: int) -> set[str]:
+    """:return: the video ids of failed tracks, that are not to be retried yet"""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "select video_id from failed_track where alid = ? and next_attempt > ?",
+            (alid, int(time.time())),
+        )
+        res = cur.fetchall()
+    return {i[0] for i in res}
+
+
+def insert_job(alid: int, video_id: str, job: str):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            """
+        insert or replace into job (alid, video_id, job, updated)
+        values (?, ?, ?, strftime('%s', 'now'))
+        """,
+            (alid, video_id, job),
+        )
+
+
+def update_job(alid: int, video_id: str, state: str, tmp_path: Optional[str] = None):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute(
+            """
+        update job set state = ?, tmp_path = ?, updated = strftime('%s', 'now')
+        where alid = ? and video_id = ?
+        """,
+            (state, tmp_path, alid, video_id),
+        )
+
+
+def get_job(alid: int, video_id: str) -> Optional[tuple[str, Optional[str]]]:
+    """:return: state and temporary file of the job"""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute(
+            "select state, tmp_path from job where alid = ? and video_id = ?",
+            (alid, video_id),
+        )
+        return cur.fetchone()
+
+
+def get_jobs() -> list[tuple[str, str, Optional[str]]]:
+    """:return: the job, its state and temporary file per job"""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("select job, state, tmp_path from job order by alid, rowid")
+        return cur.fetchall()
+
+
+def count_jobs() -> int:
+    conn = get_connection()
+    with conn:
+        return conn.execute("select count(*) from job").fetchone()[0]
+
+
+def delete_job(alid: int, video_id: str):
+    conn = get_connection()
+    with metrics.timer("db_write"), conn:
+        conn.execute("delete from job where alid = ? and video_id = ?", (alid, video_id))
+
+
 def register_daemon():
     conn = get_connection()
     with conn:
@@ -314,8 +684,13 @@ def unregister_daemon():
 def daemon_running() -> bool:
     conn = get_connection()
     with conn:
-        cur = conn.execute("select pid from daemon")
-        for pid in cur.fetchall():
+        pids = conn.execute("select pid from daemon").fetchall()
+        if not pids:
+            return False
+        # only needed if a daemon registered, and slow to import
+        import psutil
+
+        for pid in pids:
             try:
                 process = psutil.Process(pid[0])
                 if 'daemon.py' in ' '.join(process.cmdline()):
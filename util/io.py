@@ -1,5 +1,7 @@
+import json
 import os
 import sys
+import threading
 from pathlib import Path
 
 from pathvalidate import sanitize_filename
@@ -16,6 +18,43 @@ def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+output_lock = threading.Lock()
+
+
+def emit_event(event: str, data: dict):
+    """prints a single line json event, as soon as it happens"""
+    line: str = json.dumps({"event": event, **data})
+    with output_lock:
+        print(line, flush=True)
+
+
+class EventList(list):
+    """A result list, that emits appended items as events instead of keeping them"""
+
+    def __init__(self, event: str):
+        super().__init__()
+        self.event: str = event
+
+    def append(self, item: dict):
+        emit_event(self.event, item)
+
+
+class EventDict(dict):
+    """A result dict, that emits an event for every new key"""
+
+    def __init__(self, event: str):
+        super().__init__()
+        self.event: str = event
+        self.lock = threading.Lock()
+
+    def __setitem__(self, key: str, value: dict):
+        with self.lock:
+            if key in self:
+                return
+            super().__setitem__(key, value)
+        emit_event(self.event, {"id": key, **value})
+
+
 def get_output_pipe():
     if types.Options().background:
         return open(os.devnull, "w")
@@ -37,3 +76,7 @@ def join_and_create(base: Path, added: str) -> Path:
     joined = base.joinpath(new_filename)
     joined.mkdir(parents=True, exist_ok=True)
     return joined
+
+
+def get_track_filename(track_id: int, title: str, extension: str) -> str:
+    return f"{track_id:02} - {sanitize_filename(title)}.{extension}"
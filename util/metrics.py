@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+PREFIX: str = "music_channel_downloader"
+
+lock = threading.Lock()
+# stage: [count, total seconds, maximum seconds]
+durations: dict[str, list[float]] = {}
+counters: dict[str, float] = {}
+started: float = time.time()
+
+
+def observe(stage: str, seconds: float):
+    with lock:
+        duration = durations.setdefault(stage, [0, 0.0, 0.0])
+        duration[0] += 1
+        duration[1] += seconds
+        duration[2] = max(duration[2], seconds)
+
+
+def count(name: str, value: float = 1):
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """measures the duration of a stage, including failed attempts"""
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def snapshot() -> dict:
+    with lock:
+        return {
+            "started": started,
+            "time": time.time(),
+            "stages": {
+                stage: {"count": int(c), "seconds": total, "max_seconds": maximum}
+                for stage, (c, total, maximum) in durations.items()
+            },
+            "counters": dict(counters),
+        }
+
+
+def to_prometheus() -> str:
+    current: dict = snapshot()
+    lines: list[str] = [
+        f"# TYPE {PREFIX}_stage_seconds summary",
+    ]
+    for stage, values in sorted(current["stages"].items()):
+        lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {values["seconds"]}')
+    lines.append(f"# TYPE {PREFIX}_stage_max_seconds gauge")
+    for stage, values in sorted(current["stages"].items()):
+        lines.append(f'{PREFIX}_stage_max_seconds{{stage="{stage}"}} {values["max_seconds"]}')
+    lines.append(f"# TYPE {PREFIX}_events_total counter")
+    for name, value in sorted(current["counters"].items()):
+        lines.append(f'{PREFIX}_events_total{{name="{name}"}} {value}')
+    lines.append(f"# TYPE {PREFIX}_start_time_seconds gauge")
+    lines.append(f"{PREFIX}_start_time_seconds {current['started']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path: Path):
+    """writes a json snapshot if the path ends with .json, otherwise the prometheus text format"""
+    if path.suffix == ".json":
+        content: str = json.dumps(snapshot())
+    else:
+        content = to_prometheus()
+    # replace atomically, so scrapers never read a partial file
+    tmp_path: Path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
+
+
+def start_exporter(path: Optional[Path], interval: float = 60.0):
+    """periodically exports the metrics in the background, if a path is given"""
+    if not path:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                export(path)
+            except OSError:
+                ...
+
+    threading.Thread(target=run, daemon=True, name="metrics exporter").start()
@@ -0,0 +1,93 @@
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+# numbered threads (e.g. pool workers) are aggregated under a single name
+THREAD_NUMBER_REGEX: re.Pattern = re.compile(r"[_-]\d+$")
+
+
+def format_frame(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Periodically samples the stacks of all threads, and writes them as collapsed
+    stacks (one "thread;outer;...;inner count" line per stack), which can be
+    turned into a flamegraph by e.g. flamegraph.pl or speedscope.
+    While disabled, the sampling thread is blocked and costs nothing.
+    """
+
+    def __init__(self, output: Path, interval: float = 0.01, write_interval: float = 60.0):
+        self.output: Path = output
+        self.interval: float = interval
+        self.write_interval: float = write_interval
+        self.enabled = threading.Event()
+        self.lock = threading.Lock()
+        self.stacks: Counter[str] = Counter()
+        self.thread = threading.Thread(target=self.run, daemon=True, name="profiler")
+        self.thread.start()
+
+    def sample(self):
+        names: dict[Optional[int], str] = {
+            thread.ident: THREAD_NUMBER_REGEX.sub("", thread.name)
+            for thread in threading.enumerate()
+        }
+        own_ident: Optional[int] = threading.get_ident()
+        samples: list[str] = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack: list[str] = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            samples.append(";".join(reversed(stack)))
+        with self.lock:
+            self.stacks.update(samples)
+
+    def run(self):
+        last_write: float = time.monotonic()
+        while True:
+            self.enabled.wait()
+            self.sample()
+            time.sleep(self.interval)
+            if time.monotonic() - last_write > self.write_interval:
+                self.write()
+                last_write = time.monotonic()
+
+    def write(self):
+        with self.lock:
+            lines: list[str] = [f"{stack} {count}" for stack, count in self.stacks.items()]
+        tmp_path: Path = self.output.with_name(f".{self.output.name}.tmp")
+        tmp_path.write_text("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.output)
+
+    def start(self):
+        self.enabled.set()
+
+    def stop(self):
+        self.enabled.clear()
+        self.write()
+
+    def toggle(self, *_):
+        if self.enabled.is_set():
+            self.stop()
+            print(f"Profiling paused, written to {self.output}")
+        else:
+            self.start()
+            print("Profiling resumed")
+
+    def register_signal(self):
+        """toggles profiling on SIGUSR1"""
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, self.toggle)
@@ -0,0 +1,247 @@
+"""
+Records the responses of YouTube and YouTube Music once, and replays them
+afterwards, so tests and benchmarks run offline and deterministically.
+
+The mode is read from the MCD_REPLAY environment variable:
+ - replay (default): only replay, missing responses raise MissingResponse
+ - auto: replay recorded responses, record missing ones
+ - record: always send live requests, and record their responses
+Only auto and record write cassettes, so they are never changed unasked.
+"""
+
+import json
+import os
+import threading
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from util.types import PlaylistEntry
+
+MODE_VARIABLE: str = "MCD_REPLAY"
+MODES: tuple[str, ...] = ("replay", "auto", "record")
+
+
+class MissingResponse(LookupError):
+    pass
+
+
+class Cassette:
+    """
+    A file of recorded responses. Used as a context manager, it replaces the
+    clients used by the process modules with recording/replaying ones.
+    """
+
+    def __init__(self, path: Path, mode: Optional[str] = None):
+        self.path: Path = Path(path)
+        self.mode: str = mode or os.environ.get(MODE_VARIABLE) or "replay"
+        if self.mode not in MODES:
+            raise ValueError(f"{MODE_VARIABLE} has to be one of {', '.join(MODES)}")
+        self.lock = threading.Lock()
+        self.responses: dict[str, Any] = {}
+        if self.path.exists():
+            self.responses = json.loads(self.path.read_text())
+        self.changed: bool = False
+        self.patched: list[tuple[Any, str, Any]] = []
+
+    def get(self, kind: str, arguments: list, fetch: Callable[[], Any]) -> Any:
+        """
+        :param kind: the kind of request, e.g. the method name
+        :param arguments: the json serializable arguments identifying the request
+        :param fetch: sends the live request, returns a json serializable response
+        :return: a copy of the recorded response
+        """
+        key: str = f"{kind} {json.dumps(arguments, sort_keys=True)}"
+        with self.lock:
+            if self.mode != "record" and key in self.responses:
+                return deepcopy(self.responses[key])
+        if self.mode == "replay":
+            raise MissingResponse(f"{key} is not recorded in {self.path}")
+        response: Any = fetch()
+        with self.lock:
+            self.responses[key] = response
+            self.changed = True
+        return deepcopy(response)
+
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path: Path = self.path.with_name(f".{self.path.name}.tmp")
+            tmp_path.write_text(json.dumps(self.responses, indent=1, sort_keys=True))
+            os.replace(tmp_path, self.path)
+            self.changed = False
+
+    def patch(self, module: Any, name: str, value: Any):
+        self.patched.append((module, name, getattr(module, name)))
+        setattr(module, name, value)
+
+    def __enter__(self) -> "Cassette":
+        import process.track
+        import process.util
+
+        self.patch(process.util, "ytmusic", ReplayYTMusic(self, process.util.ytmusic))
+        for name in ("VideosSearch", "ChannelsSearch", "CustomSearch"):
+            self.patch(process.util, name, replay_search(self, name, getattr(process.util, name)))
+        self.patch(process.util, "AlbumPlaylist", replay_playlist(self, process.util.AlbumPlaylist))
+        youtube = replay_youtube(self, process.track.YouTube)
+        self.patch(process.util, "YouTube", youtube)
+        self.patch(process.track, "YouTube", youtube)
+        # memoized albums might have been fetched without the cassette
+        process.util.album_flight.clear()
+        return self
+
+    def __exit__(self, *_):
+        while self.patched:
+            module, name, value = self.patched.pop()
+            setattr(module, name, value)
+        self.save()
+
+
+class ReplayYTMusic:
+    """records every method call of the wrapped YTMusic client"""
+
+    def __init__(self, cassette: Cassette, live: Any):
+        self.cassette: Cassette = cassette
+        # only created, once a response needs to be recorded
+        self.live: Any = live
+
+    def get_live(self) -> Any:
+        from process.util import create_ytmusic
+
+        with self.cassette.lock:
+            if self.live is None:
+                self.live = create_ytmusic()
+            return self.live
+
+    def __getattr__(self, name: str) -> Callable:
+        def call(*args, **kwargs) -> Any:
+            return self.cassette.get(
+                f"ytmusic.{name}",
+                [args, kwargs],
+                lambda: getattr(self.get_live(), name)(*args, **kwargs),
+            )
+
+        return call
+
+
+def replay_search(cassette: Cassette, name: str, live: type) -> type:
+    """replaces one of the youtubesearchpython search classes"""
+
+    class ReplaySearch:
+        def __init__(self, *args):
+            def fetch() -> dict:
+                search = live(*args)
+                # only the first entry is used, to find corrected queries
+                return {
+                    "result": search.result()["result"],
+                    "responseSource": search.responseSource[:1],
+                }
+
+            response: dict = cassette.get(name, list(args), fetch)
+            self.responseSource: list = response["responseSource"]
+            self.response: dict = {"result": response["result"]}
+
+        def result(self) -> dict:
+            return self.response
+
+    return ReplaySearch
+
+
+def replay_playlist(cassette: Cassette, live: type) -> type:
+    """replaces AlbumPlaylist, with the video urls and entries of the playlist pages"""
+
+    class ReplayPlaylist:
+        def __init__(self, url: str):
+            def fetch() -> dict:
+                playlist = live(url)
+                video_urls: list[str] = list(playlist.video_urls)
+                return {"video_urls": video_urls, "entries": playlist.entries}
+
+            response: dict = cassette.get("playlist", [url], fetch)
+            self.video_urls: list[str] = response["video_urls"]
+            self.entries: dict[str, PlaylistEntry] = response["entries"]
+
+        def get_entry(self, video_url: str) -> PlaylistEntry:
+            video_id: str = video_url.split("v=")[-1]
+            return self.entries.get(video_id, {"title": None, "duration_seconds": None})
+
+    return ReplayPlaylist
+
+
+STREAM_ATTRIBUTES: tuple[str, ...] = (
+    "itag", "subtype", "bitrate", "type", "is_progressive", "resolution", "abr"
+)
+
+
+def replay_youtube(cassette: Cassette, live: type) -> type:
+    """
+    replaces pytubefix.YouTube, with its metadata and stream manifest.
+    Downloads are not recorded, they need the live video.
+    """
+
+    class ReplayStream:
+        def __init__(self, video: "ReplayYouTube", attributes: dict):
+            self.video: ReplayYouTube = video
+            for attribute in STREAM_ATTRIBUTES:
+                setattr(self, attribute, attributes[attribute])
+
+        def download(self, **kwargs) -> str:
+            if cassette.mode == "replay":
+                raise MissingResponse(f"downloads of {self.video.url} can not be replayed")
+            video = live(self.video.url)
+            if self.video.on_progress:
+                video.register_on_progress_callback(self.video.on_progress)
+            return video.streams.get_by_itag(self.itag).download(**kwargs)
+
+    class ReplayStreamQuery:
+        def __init__(self, streams: list[ReplayStream]):
+            self.streams: list[ReplayStream] = streams
+
+        def get_audio_only(self, subtype: str = "mp4") -> Optional[ReplayStream]:
+            audio: list[ReplayStream] = [
+                stream for stream in self.streams
+                if stream.type == "audio" and stream.subtype == subtype
+            ]
+            return max(audio, key=lambda stream: stream.bitrate or 0, default=None)
+
+        def get_highest_resolution(self) -> Optional[ReplayStream]:
+            progressive: list[ReplayStream] = [
+                stream for stream in self.streams if stream.is_progressive
+            ]
+            return max(
+                progressive,
+                key=lambda stream: int((stream.resolution or "0p")[:-1]),
+                default=None,
+            )
+
+    class ReplayYouTube:
+        def __init__(self, url: str):
+            def fetch() -> dict:
+                video = live(url)
+                return {
+                    "title": video.title,
+                    "length": video.length,
+                    "streaming_data": video.streaming_data,
+                    "streams": [
+                        {attribute: getattr(stream, attribute) for attribute in STREAM_ATTRIBUTES}
+                        for stream in video.streams
+                    ],
+                }
+
+            response: dict = cassette.get("youtube", [url], fetch)
+            self.url: str = url
+            self.visitor_data: Optional[str] = None
+            self.title: str = response["title"]
+            self.length: int = response["length"]
+            self.streaming_data: dict = response["streaming_data"]
+            self.streams = ReplayStreamQuery(
+                [ReplayStream(self, stream) for stream in response["streams"]]
+            )
+            self.on_progress: Optional[Callable] = None
+
+        def register_on_progress_callback(self, callback: Callable):
+            self.on_progress = callback
+
+    return ReplayYouTube
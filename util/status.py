@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from util import types, database, metrics
+
+lock = threading.Lock()
+# (alid, video id): title, album, stage, time the stage has been entered
+in_flight: dict[tuple[int, str], tuple[str, str, str, float]] = {}
+last_errors: deque[types.ResultError] = deque(maxlen=20)
+# cleared while paused, checked before starting new work
+running = threading.Event()
+running.set()
+# time until which no requests are sent, due to bot detection
+backoff_until: float = 0.0
+
+
+def set_stage(job: types.TrackJob, stage: str):
+    video_id: str = database.get_video_id_for_track(job.track)
+    with lock:
+        in_flight[(job.alid, video_id)] = (
+            job.track["title"],
+            job.album_title,
+            stage,
+            time.time(),
+        )
+
+
+def finish(job: types.TrackJob):
+    video_id: str = database.get_video_id_for_track(job.track)
+    with lock:
+        in_flight.pop((job.alid, video_id), None)
+
+
+def add_error(error: types.ResultError):
+    with lock:
+        last_errors.append(error)
+
+
+def back_off(seconds: float):
+    global backoff_until
+    backoff_until = time.time() + seconds
+
+
+def wait_if_paused():
+    running.wait()
+
+
+def get_status() -> dict:
+    with lock:
+        tracks = [
+            {"title": title, "album": album, "stage": stage, "since": since}
+            for title, album, stage, since in in_flight.values()
+        ]
+        errors = list(last_errors)
+    return {
+        "paused": not running.is_set(),
+        "queued_tracks": database.count_jobs(),
+        "in_flight": tracks,
+        "backoff_until": backoff_until if backoff_until > time.time() else None,
+        "last_errors": errors,
+        "metrics": metrics.snapshot(),
+    }
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    """
+    GET /status: the current state as json
+    POST /pause, /resume: stop and continue starting new albums and artists
+    POST /refresh?channel_id=...: update an artist as soon as possible
+    """
+
+    def send_json(self, code: int, data: dict):
+        body: bytes = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/status":
+            self.send_json(200, get_status())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path == "/pause":
+            running.clear()
+        elif url.path == "/resume":
+            running.set()
+        elif url.path == "/refresh":
+            channel_id: Optional[str] = parse_qs(url.query).get("channel_id", [None])[0]
+            if not channel_id or not database.schedule_artist_update(channel_id):
+                self.send_json(404, {"error": "unknown channel_id"})
+                return
+        else:
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_json(200, {"paused": not running.is_set()})
+
+    def log_message(self, *_):
+        ...
+
+
+def start_server(port: Optional[int]):
+    """serves the status api on localhost in the background, if a port is given"""
+    if port is None:
+        return
+    server = ThreadingHTTPServer(("127.0.0.1", port), StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="status api").start()
@@ -77,12 +77,128 @@ class Album(TypedDict):
     path: str
 
 
+class PlaylistEntry(TypedDict):
+    title: Optional[str]
+    duration_seconds: Optional[int]
+
+
+class TrackJob:
+    """
+    Everything needed to process a single track. Only the required fields are
+    copied from ytmusicapi, so the complete albums and artists can be freed
+    while their tracks are still queued.
+    """
+
+    __slots__ = (
+        "track",
+        "track_index",
+        "album_title",
+        "album_year",
+        "playlist_id",
+        "artist_name",
+        "album_destination",
+        "alid",
+        "video_url",
+    )
+    # the keys of a track, that are needed for processing it
+    TRACK_KEYS: tuple[str, ...] = (
+        "videoId",
+        "title",
+        "artists",
+        "duration",
+        "duration_seconds",
+    )
+
+    def __init__(
+        self,
+        track: Track,
+        track_index: int,
+        album_title: str,
+        album_year: str,
+        playlist_id: str,
+        artist_name: str,
+        album_destination: Path,
+        alid: int,
+        video_url: Optional[str],
+    ):
+        self.track: Track = track
+        self.track_index: int = track_index
+        self.album_title: str = album_title
+        self.album_year: str = album_year
+        self.playlist_id: str = playlist_id
+        self.artist_name: str = artist_name
+        self.album_destination: Path = album_destination
+        self.alid: int = alid
+        self.video_url: Optional[str] = video_url
+
+    @staticmethod
+    def from_ytmusic(
+        track_index: int,
+        album: Album,
+        artist: Artist,
+        album_destination: Path,
+        alid: int,
+        video_url: Optional[str],
+    ):
+        track: Track = album["tracks"][track_index]
+        return TrackJob(
+            {key: track[key] for key in TrackJob.TRACK_KEYS if key in track},
+            track_index,
+            album["title"],
+            album.get("year", "0"),
+            album["audioPlaylistId"],
+            artist["name"],
+            album_destination,
+            alid,
+            video_url,
+        )
+
+    def to_dict(self) -> dict:
+        result = {key: getattr(self, key) for key in self.__slots__}
+        result["album_destination"] = str(self.album_destination)
+        return result
+
+    @staticmethod
+    def from_dict(data: dict):
+        data = dict(data)
+        data["album_destination"] = Path(data["album_destination"])
+        return TrackJob(**data)
+
+
+class EncoderProfile(TypedDict):
+    # soxr precision in bits, when resampling the loudness normalized audio
+    resampler_precision: int
+    # libopus compression level, 0 (fast) to 10 (best)
+    opus_complexity: int
+    # lame algorithm quality, 9 (fast) to 0 (best)
+    lame_quality: int
+
+
+# the archival profile matches the encoding before profiles existed
+ENCODER_PROFILES: dict[str, EncoderProfile] = {
+    "fast": {"resampler_precision": 20, "opus_complexity": 5, "lame_quality": 7},
+    "balanced": {"resampler_precision": 28, "opus_complexity": 8, "lame_quality": 5},
+    "archival": {"resampler_precision": 33, "opus_complexity": 10, "lame_quality": 3},
+}
+
+
 class Options:
     processing_threads: int
     background: bool
     album_only: bool
     mp3: bool
     no_singles: bool
+    stream_analysis: bool = False
+    deep: bool = False
+    # in seconds, 0 disables the search cache
+    search_cache_ttl: int = 7 * 24 * 60 * 60
+    search_cache_size: int = 100_000
+    # in pixels, 0 disables embedding the cover into tracks
+    cover_size: int = 600
+    # also embed the cover into tracks downloaded before, rewriting them once
+    embed_existing_covers: bool = False
+    # one of ENCODER_PROFILES
+    encoder_profile: str = "archival"
 
 
 class ResultTrack(TypedDict):
@@ -114,15 +230,30 @@ class Result(TypedDict):
 ResultTuple = tuple[list[ResultTrack], dict[str, ResultAlbum], list[ResultError]]
 
 
+class AuditIssue(TypedDict):
+    issue: str
+    path: str
+    detail: str
+    tid: Optional[int]
+
+
 class Arguments:
     threads: int
     background: bool
+    ndjson: bool
     album_only: bool
+    deep: bool
     name: list[str]
     destination: Path
     channel_id: list[str]
     mp3: bool
     no_singles: bool
+    stream_analysis: bool
+    search_cache_ttl: int
+    cover_size: int
+    embed_existing_covers: bool
+    encoder_profile: str
+    metrics_file: Optional[Path]
 
 
 class YoutubeSearchVideoResultChannel(TypedDict):